@@ -0,0 +1,60 @@
+"""Compare creating notes one request at a time with the batch endpoint.
+
+Run from the project root:
+
+    python -m benchmarks.batch_notes --notes 200
+
+Uses a throwaway SQLite database unless BENCH_DATABASE_URL is set.
+"""
+
+import argparse
+import time
+
+from flask_jwt_extended import create_access_token
+
+from benchmarks.common import bench_app, create_user
+from src.extensions import db
+from src.models.users import User
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=200)
+    args = parser.parse_args()
+
+    with bench_app() as app:
+        user_id = create_user()
+        token = create_access_token(identity=db.session.get(User, user_id))
+        headers = {"Authorization": f"Bearer {token}"}
+        url = f"/api/users/{user_id}/notes/"
+        client = app.test_client()
+
+        def one_by_one():
+            for i in range(args.notes):
+                response = client.post(
+                    url, json={"title": f"Note {i}"}, headers=headers
+                )
+                assert response.status_code == 201, response.json
+
+        def batched():
+            operations = [
+                {"op": "create", "data": {"title": f"Note {i}"}}
+                for i in range(args.notes)
+            ]
+            response = client.post(
+                f"{url}batch",
+                json={"operations": operations},
+                headers=headers,
+            )
+            assert response.status_code == 200, response.json
+
+        print(f"{'mode':<12} {'notes/s':>12}")
+        for label, func in [("single", one_by_one), ("batch", batched)]:
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            print(f"{label:<12} {args.notes / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
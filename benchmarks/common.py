@@ -0,0 +1,51 @@
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from flask_migrate import upgrade
+from sqlalchemy import insert
+
+from src import create_app
+from src.extensions import db
+from src.models.users import User
+
+
+@contextmanager
+def bench_app():
+    """App context on BENCH_DATABASE_URL, or a throwaway SQLite file"""
+    with tempfile.TemporaryDirectory() as tmp:
+        url = os.getenv(
+            "BENCH_DATABASE_URL", f"sqlite:///{os.path.join(tmp, 'b.db')}"
+        )
+        app = create_app({"SQLALCHEMY_DATABASE_URI": url, "TESTING": True})
+        with app.app_context():
+            upgrade()
+            yield app
+            db.session.remove()
+            db.engine.dispose()
+
+
+def create_user(email="bench@example.com"):
+    user = User.create(
+        {"first_name": "Bench", "last_name": "User", "email": email},
+        commit=True,
+    )
+    return user.id
+
+
+def bulk_insert(model, rows, batch_size=5000):
+    for start in range(0, len(rows), batch_size):
+        end = start + batch_size
+        db.session.execute(insert(model), rows[start:end])
+    db.session.commit()
+
+
+def median_ms(func, repeat=20):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
@@ -0,0 +1,64 @@
+"""Compare password hasher settings.
+
+Run from the project root, e.g.:
+
+    python -m benchmarks.hashers --bcrypt-rounds 10 12 14
+    python -m benchmarks.hashers --argon2 2,19456,1 3,65536,4
+
+Argon2 settings are ``time_cost,memory_cost_kib,parallelism`` and need
+the argon2-cffi package.
+"""
+
+import argparse
+import statistics
+import time
+
+from src.hashers import Argon2Hasher, BcryptHasher
+
+PASSWORD = "Benchmark123@Password"
+
+
+def bench(hasher, iterations):
+    hash_times = []
+    verify_times = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        password_hash = hasher.hash(PASSWORD)
+        hash_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        assert hasher.verify(password_hash, PASSWORD)
+        verify_times.append(time.perf_counter() - started)
+    return statistics.median(hash_times), statistics.median(verify_times)
+
+
+def parse_argon2(value):
+    time_cost, memory_cost, parallelism = (int(v) for v in value.split(","))
+    return Argon2Hasher(
+        time_cost=time_cost,
+        memory_cost=memory_cost,
+        parallelism=parallelism,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--bcrypt-rounds", type=int, nargs="*", default=[10, 12, 14]
+    )
+    parser.add_argument("--argon2", type=parse_argon2, nargs="*", default=[])
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    hashers = [BcryptHasher(rounds=r) for r in args.bcrypt_rounds]
+    hashers += args.argon2
+    print(f"{'hasher':<60} {'hash ms':>10} {'verify ms':>10}")
+    for hasher in hashers:
+        hash_time, verify_time = bench(hasher, args.iterations)
+        print(
+            f"{repr(hasher):<60} {hash_time * 1000:>10.1f} "
+            f"{verify_time * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Compare list pages read as ORM entities and as read-only records.
+
+Run from the project root:
+
+    python -m benchmarks.list_projection --notes 5000 --page 500
+
+Each page is queried and dumped the way the list endpoints do it, in a
+fresh session. Peak memory is the largest allocation tracemalloc sees
+while building and dumping one page. Uses a throwaway SQLite database
+unless BENCH_DATABASE_URL is set.
+"""
+
+import argparse
+import tracemalloc
+
+from benchmarks.common import bench_app, bulk_insert, create_user, median_ms
+from src.extensions import db
+from src.models.categories import Category
+from src.models.notes import Note
+from src.schemas.categories import CategoryListItemSchema
+from src.schemas.notes import NoteSchema, SparseNoteSchema
+
+
+def peak_kib(func):
+    db.session.remove()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=500)
+    parser.add_argument("--page", type=int, default=500)
+    args = parser.parse_args()
+
+    with bench_app():
+        user_id = create_user()
+        bulk_insert(
+            Category,
+            [
+                {"user_id": user_id, "name": f"Category {i}"}
+                for i in range(args.categories)
+            ],
+        )
+        bulk_insert(
+            Note,
+            [
+                {
+                    "user_id": user_id,
+                    "title": f"Note {i}",
+                    "content": "Lorem ipsum dolor sit amet " * 8,
+                    "category_id": i % (args.categories + 1) or None,
+                }
+                for i in range(args.notes)
+            ],
+        )
+
+        sparse = ["id", "title", "category", "excerpt"]
+
+        def page(model, schema, read_only, previews=False, **filters):
+            def run():
+                db.session.remove()
+                items = model.filter(
+                    user_id, limit=args.page, read_only=read_only, **filters
+                )
+                if previews:
+                    Category.with_note_previews(items, 5)
+                return schema.dump(items)
+
+            return run
+
+        cases = [
+            ("notes", Note, NoteSchema(many=True), {}),
+            (
+                "notes, sparse",
+                Note,
+                SparseNoteSchema(only=sparse, many=True),
+                {"only": sparse, "excerpt_length": 40},
+            ),
+            (
+                "categories",
+                Category,
+                CategoryListItemSchema(many=True),
+                {"previews": True},
+            ),
+        ]
+        print(
+            f"{'page':<16} {'orm ms':>10} {'records ms':>11} "
+            f"{'orm KiB':>10} {'records KiB':>12}"
+        )
+        for label, model, schema, filters in cases:
+            orm = page(model, schema, False, **filters)
+            records = page(model, schema, True, **filters)
+            assert orm() == records()
+            print(
+                f"{label:<16} {median_ms(orm):>10.2f} "
+                f"{median_ms(records):>11.2f} "
+                f"{peak_kib(orm):>10.0f} {peak_kib(records):>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compare marshmallow and compiled dumps, and the two JSON providers.
+
+Run from the project root:
+
+    python -m benchmarks.serializers --notes 500 [--unicode]
+
+With --unicode titles and category names are not ASCII, which the
+orjson provider hands to the standard library unless ensure_ascii is
+off. Objects are built in memory, nothing is written to the database.
+"""
+
+import argparse
+from datetime import datetime, timezone
+
+from flask.json.provider import DefaultJSONProvider
+from marshmallow import Schema
+
+from benchmarks.common import bench_app, median_ms
+from src.json_provider import ORJSONProvider, orjson
+from src.models.categories import Category
+from src.models.notes import Note
+from src.schemas.notes import NoteSchema
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--unicode", action="store_true")
+    args = parser.parse_args()
+
+    with bench_app() as app:
+        accent = "é ✓" if args.unicode else "e"
+        now = datetime.now(timezone.utc)
+        categories = [
+            Category(id=i, user_id=1, name=f"Cat{accent} {i}", color="#ffcc00")
+            for i in range(10)
+        ]
+        notes = []
+        for i in range(args.notes):
+            category = categories[i % 11] if i % 11 < 10 else None
+            notes.append(
+                Note(
+                    id=i,
+                    user_id=1,
+                    title=f"Note {accent} {i}",
+                    content="Lorem ipsum dolor sit amet " * 8,
+                    archived=False,
+                    category_id=category.id if category else None,
+                    category=category,
+                    created_at=now,
+                    updated_at=now,
+                )
+            )
+
+        schema = NoteSchema(many=True)
+        expected = Schema.dump(schema, notes)
+        assert schema.dump(notes) == expected
+
+        rows = [
+            ("marshmallow", lambda: Schema.dump(schema, notes)),
+            ("compiled", lambda: schema.dump(notes)),
+        ]
+        default = DefaultJSONProvider(app)
+        compact = {"separators": (",", ":")}
+        payload = {"data": expected}
+        rows.append(("json", lambda: default.dumps(payload, **compact)))
+        if orjson is not None:
+            provider = ORJSONProvider(app)
+            assert provider.dumps(payload, **compact) == default.dumps(
+                payload, **compact
+            )
+            rows.append(("orjson", lambda: provider.dumps(payload, **compact)))
+            utf8 = ORJSONProvider(app)
+            utf8.ensure_ascii = False
+            rows.append(
+                ("orjson utf-8", lambda: utf8.dumps(payload, **compact))
+            )
+
+        print(f"{'step':<12} {'ms':>10}")
+        for label, func in rows:
+            print(f"{label:<12} {median_ms(func):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare trigram indexed substring filters with a plain ILIKE scan.
+
+Run from the project root:
+
+    python -m benchmarks.substring_filter --notes 50000
+
+Uses a throwaway SQLite database unless BENCH_DATABASE_URL is set.
+"""
+
+import argparse
+import random
+
+from sqlalchemy import select
+
+from benchmarks.common import bench_app, bulk_insert, create_user, median_ms
+from src.extensions import db
+from src.models.categories import Category
+from src.models.notes import Note
+
+WORDS = (
+    "alpha bravo charlie delta echo foxtrot golf hotel india juliet".split()
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=50000)
+    parser.add_argument("--categories", type=int, default=2000)
+    parser.add_argument("--term", default="golf hotel ind")
+    args = parser.parse_args()
+
+    with bench_app():
+        user_id = create_user()
+        rng = random.Random(0)
+        bulk_insert(
+            Note,
+            [
+                {
+                    "user_id": user_id,
+                    "title": " ".join(rng.choices(WORDS, k=4)),
+                    "content": "",
+                }
+                for _ in range(args.notes)
+            ],
+        )
+        bulk_insert(
+            Category,
+            [
+                {"user_id": user_id, "name": " ".join(rng.choices(WORDS, k=2))}
+                for _ in range(args.categories)
+            ],
+        )
+
+        def indexed_notes():
+            Note.filter(user_id, title=args.term, limit=100)
+
+        def ilike_notes():
+            db.session.scalars(
+                Note.select_active()
+                .where(
+                    Note.user_id == user_id,
+                    Note.archived.is_(False),
+                    Note.title.ilike(f"%{args.term}%"),
+                )
+                .order_by(Note.created_at.desc(), Note.id.desc())
+                .limit(100)
+            ).all()
+
+        def indexed_categories():
+            Category.filter(user_id, name=args.term)
+
+        def ilike_categories():
+            db.session.scalars(
+                select(Category).where(
+                    Category.user_id == user_id,
+                    Category.deleted_at.is_(None),
+                    Category.name.ilike(f"%{args.term}%"),
+                )
+            ).all()
+
+        print(f"{'query':<24} {'indexed ms':>12} {'ilike ms':>12}")
+        for label, indexed, ilike in [
+            ("notes.title", indexed_notes, ilike_notes),
+            ("categories.name", indexed_categories, ilike_categories),
+        ]:
+            print(
+                f"{label:<24} {median_ms(indexed):>12.2f} "
+                f"{median_ms(ilike):>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -93,7 +93,21 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info("No changes in schema detected.")
 
+    # Search index objects are created by hand in migrations and are not
+    # part of the models, so keep autogenerate from dropping them.
+    def include_object(object, name, type_, reflected, compare_to):
+        if type_ == "table" and (
+            name.startswith("notes_fts") or "_trgm" in name
+        ):
+            return False
+        if type_ == "index" and name.endswith("_trgm"):
+            return False
+        if name in ("search_vector", "idx_notes_search_vector"):
+            return False
+        return True
+
     conf_args = current_app.extensions["migrate"].configure_args
+    conf_args.setdefault("include_object", include_object)
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
 
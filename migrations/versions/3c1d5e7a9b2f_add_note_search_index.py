@@ -0,0 +1,72 @@
+"""add note search index
+
+Revision ID: 3c1d5e7a9b2f
+Revises: af814f7b55d0
+Create Date: 2026-10-18 10:12:41.503226
+
+Postgres gets a generated tsvector column with a GIN index. SQLite gets
+an external-content FTS5 table kept in sync with triggers; note that
+batch operations that recreate the notes table drop these triggers.
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "3c1d5e7a9b2f"
+down_revision = "af814f7b55d0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute(
+            "ALTER TABLE notes ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple', "
+            "coalesce(title, '') || ' ' || coalesce(content, ''))) STORED"
+        )
+        op.create_index(
+            "idx_notes_search_vector",
+            "notes",
+            ["search_vector"],
+            postgresql_using="gin",
+        )
+    elif dialect == "sqlite":
+        op.execute(
+            "CREATE VIRTUAL TABLE notes_fts USING fts5("
+            "title, content, content='notes', content_rowid='id')"
+        )
+        op.execute(
+            "CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN "
+            "INSERT INTO notes_fts(rowid, title, content) "
+            "VALUES (new.id, new.title, new.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN "
+            "INSERT INTO notes_fts(notes_fts, rowid, title, content) "
+            "VALUES ('delete', old.id, old.title, old.content); END"
+        )
+        op.execute(
+            "CREATE TRIGGER notes_fts_update AFTER UPDATE OF title, content "
+            "ON notes BEGIN "
+            "INSERT INTO notes_fts(notes_fts, rowid, title, content) "
+            "VALUES ('delete', old.id, old.title, old.content); "
+            "INSERT INTO notes_fts(rowid, title, content) "
+            "VALUES (new.id, new.title, new.content); END"
+        )
+        op.execute("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.drop_index("idx_notes_search_vector", table_name="notes")
+        op.execute("ALTER TABLE notes DROP COLUMN search_vector")
+    elif dialect == "sqlite":
+        op.execute("DROP TRIGGER IF EXISTS notes_fts_update")
+        op.execute("DROP TRIGGER IF EXISTS notes_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS notes_fts_insert")
+        op.execute("DROP TABLE IF EXISTS notes_fts")
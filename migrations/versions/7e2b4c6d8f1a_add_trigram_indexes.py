@@ -0,0 +1,76 @@
+"""add trigram indexes for substring filters
+
+Revision ID: 7e2b4c6d8f1a
+Revises: 3c1d5e7a9b2f
+Create Date: 2026-10-18 11:03:27.918443
+
+Postgres gets pg_trgm GIN indexes on notes.title and categories.name.
+SQLite gets external-content FTS5 trigram tables named
+<table>_<column>_trgm, kept in sync with triggers.
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "7e2b4c6d8f1a"
+down_revision = "3c1d5e7a9b2f"
+branch_labels = None
+depends_on = None
+
+TRIGRAM_COLUMNS = [("notes", "title"), ("categories", "name")]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table, column in TRIGRAM_COLUMNS:
+            op.create_index(
+                f"idx_{table}_{column}_trgm",
+                table,
+                [column],
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+            )
+    elif dialect == "sqlite":
+        for table, column in TRIGRAM_COLUMNS:
+            name = f"{table}_{column}_trgm"
+            op.execute(
+                f"CREATE VIRTUAL TABLE {name} USING fts5({column}, "
+                f"content='{table}', content_rowid='id', "
+                "tokenize='trigram')"
+            )
+            op.execute(
+                f"CREATE TRIGGER {name}_insert AFTER INSERT ON {table} "
+                f"BEGIN INSERT INTO {name}(rowid, {column}) "
+                f"VALUES (new.id, new.{column}); END"
+            )
+            op.execute(
+                f"CREATE TRIGGER {name}_delete AFTER DELETE ON {table} "
+                f"BEGIN INSERT INTO {name}({name}, rowid, {column}) "
+                f"VALUES ('delete', old.id, old.{column}); END"
+            )
+            op.execute(
+                f"CREATE TRIGGER {name}_update AFTER UPDATE OF {column} "
+                f"ON {table} BEGIN "
+                f"INSERT INTO {name}({name}, rowid, {column}) "
+                f"VALUES ('delete', old.id, old.{column}); "
+                f"INSERT INTO {name}(rowid, {column}) "
+                f"VALUES (new.id, new.{column}); END"
+            )
+            op.execute(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        for table, column in TRIGRAM_COLUMNS:
+            op.drop_index(f"idx_{table}_{column}_trgm", table_name=table)
+    elif dialect == "sqlite":
+        for table, column in TRIGRAM_COLUMNS:
+            name = f"{table}_{column}_trgm"
+            for suffix in ("update", "delete", "insert"):
+                op.execute(f"DROP TRIGGER IF EXISTS {name}_{suffix}")
+            op.execute(f"DROP TABLE IF EXISTS {name}")
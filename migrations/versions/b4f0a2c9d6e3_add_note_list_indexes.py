@@ -0,0 +1,52 @@
+"""add partial indexes for the note list query
+
+Revision ID: b4f0a2c9d6e3
+Revises: 7e2b4c6d8f1a
+Create Date: 2026-10-18 11:47:05.226130
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b4f0a2c9d6e3"
+down_revision = "7e2b4c6d8f1a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("notes", schema=None) as batch_op:
+        batch_op.create_index(
+            "idx_notes_user_list",
+            [
+                "user_id",
+                "archived",
+                sa.text("created_at DESC"),
+                sa.text("id DESC"),
+            ],
+            unique=False,
+            postgresql_where=sa.text("deleted_at IS NULL"),
+            sqlite_where=sa.text("deleted_at IS NULL"),
+        )
+        batch_op.create_index(
+            "idx_notes_user_category_list",
+            [
+                "user_id",
+                "category_id",
+                "archived",
+                sa.text("created_at DESC"),
+                sa.text("id DESC"),
+            ],
+            unique=False,
+            postgresql_where=sa.text("deleted_at IS NULL"),
+            sqlite_where=sa.text("deleted_at IS NULL"),
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("notes", schema=None) as batch_op:
+        batch_op.drop_index("idx_notes_user_category_list")
+        batch_op.drop_index("idx_notes_user_list")
@@ -0,0 +1,36 @@
+"""add partial index for the category list query
+
+Revision ID: d2a7c1e5f9b4
+Revises: b4f0a2c9d6e3
+Create Date: 2026-10-18 12:31:44.108273
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "d2a7c1e5f9b4"
+down_revision = "b4f0a2c9d6e3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("categories", schema=None) as batch_op:
+        batch_op.create_index(
+            "idx_categories_user_list",
+            [
+                "user_id",
+                sa.text("created_at DESC"),
+                sa.text("id DESC"),
+            ],
+            unique=False,
+            postgresql_where=sa.text("deleted_at IS NULL"),
+            sqlite_where=sa.text("deleted_at IS NULL"),
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("categories", schema=None) as batch_op:
+        batch_op.drop_index("idx_categories_user_list")
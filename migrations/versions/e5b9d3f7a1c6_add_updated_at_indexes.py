@@ -0,0 +1,38 @@
+"""add user_id, updated_at indexes for ETag change stamps
+
+Revision ID: e5b9d3f7a1c6
+Revises: d2a7c1e5f9b4
+Create Date: 2026-10-18 14:02:17.551906
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "e5b9d3f7a1c6"
+down_revision = "d2a7c1e5f9b4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("notes", schema=None) as batch_op:
+        batch_op.create_index(
+            "idx_notes_user_updated_at",
+            ["user_id", "updated_at"],
+            unique=False,
+        )
+    with op.batch_alter_table("categories", schema=None) as batch_op:
+        batch_op.create_index(
+            "idx_categories_user_updated_at",
+            ["user_id", "updated_at"],
+            unique=False,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("categories", schema=None) as batch_op:
+        batch_op.drop_index("idx_categories_user_updated_at")
+    with op.batch_alter_table("notes", schema=None) as batch_op:
+        batch_op.drop_index("idx_notes_user_updated_at")
@@ -4,7 +4,7 @@ from flask_jwt_extended import current_user
 from flask_babel import gettext
 from marshmallow.exceptions import ValidationError
 from http import HTTPStatus
-from datetime import timedelta, datetime, timezone
+from datetime import timedelta
 import os
 
 from src.views.notes import note_blueprint
@@ -12,7 +12,21 @@ from src.views.categories import category_blueprint
 from src.views.auth import auth_blueprint
 from src.views.users import user_blueprint
 from src.models.users import User
-from .extensions import db, migrate, bcrypt, jwt, cors, babel
+from src.json_provider import ORJSONProvider, orjson
+from .extensions import (
+    db,
+    migrate,
+    jwt,
+    cors,
+    babel,
+    identity_cache,
+    revocation_store,
+    password_pool,
+    response_cache,
+    compression,
+    profiler,
+    metrics,
+)
 
 
 def error_response(status, error, message, details=None):
@@ -71,12 +85,10 @@ def register_jwt_handlers(jwt_manager):
 
     @jwt_manager.user_lookup_loader
     def user_lookup_callback(_jwt_header, jwt_data):
-        identity = jwt_data["sub"]
-        return db.session.execute(
-            User.select_active().where(
-                User.active.is_(True), User.id == int(identity)
-            )
-        ).scalar_one_or_none()
+        user = User.get_identity(int(jwt_data["sub"]))
+        if user is None or user.deleted_at is not None or not user.active:
+            return None
+        return user
 
     @jwt_manager.user_lookup_error_loader
     def user_lookup_error_callback(jwt_header, jwt_data):
@@ -88,18 +100,20 @@ def register_jwt_handlers(jwt_manager):
 
     @jwt_manager.token_in_blocklist_loader
     def check_if_token_revoked(jwt_header, jwt_payload):
-        user = db.session.execute(
-            User.select_with_deleted().where(
-                User.id == int(jwt_payload["sub"])
-            )
-        ).scalar_one_or_none()
-        if user is None or user.deleted_at is not None or not user.active:
+        user_id = int(jwt_payload["sub"])
+        state = revocation_store.get(user_id)
+        if state is None:
+            # Store disabled or cold: fall back to the database
+            user = User.get_identity(user_id)
+            if user is None:
+                return True
+            state = user.revocation_state()
+            revocation_store.put(user_id, state, overwrite=False)
+        if state.revoked:
             return True
-        last_logout = user.last_logout_at
-        if last_logout is None:
+        if state.logout_epoch is None:
             return False
-        token_iat = datetime.fromtimestamp(jwt_payload["iat"], tz=timezone.utc)
-        return token_iat <= last_logout.replace(tzinfo=timezone.utc)
+        return jwt_payload["iat"] <= state.logout_epoch
 
     @jwt_manager.unauthorized_loader
     def jwt_missing(callback):
@@ -175,6 +189,8 @@ def create_app(test_config=None):
     app.config["JWT_COOKIE_SECURE"] = (
         os.getenv("JWT_COOKIE_SECURE", "True").lower() == "true"
     )
+    # Signs pagination cursors, falls back to JWT_SECRET_KEY
+    app.config["CURSOR_SECRET_KEY"] = os.getenv("CURSOR_SECRET_KEY")
 
     # CORS Configuration
     frontend_url = os.getenv("FRONTEND_URL", "http://localhost:3000")
@@ -194,13 +210,125 @@ def create_app(test_config=None):
     ]
     app.config["CORS_SUPPORTS_CREDENTIALS"] = True
 
+    # Per-worker cache of authenticated users, see src/identity_cache.py.
+    # Keep the TTL short: other workers only see a logout once it expires.
+    app.config["IDENTITY_CACHE_TTL"] = int(
+        os.getenv("IDENTITY_CACHE_TTL", "5")
+    )
+    app.config["IDENTITY_CACHE_MAX_SIZE"] = int(
+        os.getenv("IDENTITY_CACHE_MAX_SIZE", "1024")
+    )
+    # Optional revocation state shared by all workers on a node, e.g.
+    # /dev/shm/notes-revocation. Disabled when unset.
+    app.config["REVOCATION_STORE_PATH"] = os.getenv("REVOCATION_STORE_PATH")
+    app.config["REVOCATION_STORE_TTL"] = int(
+        os.getenv("REVOCATION_STORE_TTL", "300")
+    )
+    # Password hashing, see src/hashers.py. Existing hashes are upgraded
+    # to these settings on the next successful login.
+    app.config["PASSWORD_HASHER"] = os.getenv("PASSWORD_HASHER", "bcrypt")
+    app.config["BCRYPT_LOG_ROUNDS"] = int(os.getenv("BCRYPT_LOG_ROUNDS", "12"))
+    app.config["ARGON2_TIME_COST"] = int(os.getenv("ARGON2_TIME_COST", "3"))
+    app.config["ARGON2_MEMORY_COST"] = int(
+        os.getenv("ARGON2_MEMORY_COST", "65536")
+    )
+    app.config["ARGON2_PARALLELISM"] = int(
+        os.getenv("ARGON2_PARALLELISM", "4")
+    )
+    # Password hashing runs in a bounded pool, see src/password_pool.py
+    app.config["PASSWORD_POOL_KIND"] = os.getenv(
+        "PASSWORD_POOL_KIND", "thread"
+    )
+    app.config["PASSWORD_POOL_WORKERS"] = int(
+        os.getenv("PASSWORD_POOL_WORKERS", str(os.cpu_count() or 1))
+    )
+    app.config["PASSWORD_POOL_MAX_QUEUE"] = int(
+        os.getenv("PASSWORD_POOL_MAX_QUEUE", "8")
+    )
+
+    # Cache of list responses, see src/response_cache.py. "memory" keeps
+    # it per worker, "sqlite" shares it through RESPONSE_CACHE_PATH (e.g.
+    # /dev/shm/notes-responses.db). With more than one worker "memory"
+    # needs RESPONSE_CACHE_PATH too, for the version counters that
+    # invalidate it. Disabled when unset.
+    app.config["RESPONSE_CACHE_BACKEND"] = os.getenv("RESPONSE_CACHE_BACKEND")
+    app.config["RESPONSE_CACHE_PATH"] = os.getenv("RESPONSE_CACHE_PATH")
+    app.config["RESPONSE_CACHE_TTL"] = int(
+        os.getenv("RESPONSE_CACHE_TTL", "60")
+    )
+    app.config["RESPONSE_CACHE_MAX_ENTRIES"] = int(
+        os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")
+    )
+    # Largest number of operations accepted by the note batch endpoint
+    app.config["NOTE_BATCH_MAX_OPERATIONS"] = int(
+        os.getenv("NOTE_BATCH_MAX_OPERATIONS", "500")
+    )
+    # Notes inserted and committed at a time by the import endpoint
+    app.config["NOTE_IMPORT_BATCH_SIZE"] = int(
+        os.getenv("NOTE_IMPORT_BATCH_SIZE", "1000")
+    )
+
+    # Response compression, see src/compression.py. Encodings in order of
+    # preference, zstd and br need the zstandard and brotli packages.
+    # Empty to disable.
+    app.config["COMPRESSION_ALGORITHMS"] = os.getenv(
+        "COMPRESSION_ALGORITHMS", "zstd,br,gzip"
+    ).split(",")
+    app.config["COMPRESSION_MIN_SIZE"] = int(
+        os.getenv("COMPRESSION_MIN_SIZE", "1024")
+    )
+    app.config["COMPRESSION_GZIP_LEVEL"] = int(
+        os.getenv("COMPRESSION_GZIP_LEVEL", "6")
+    )
+    app.config["COMPRESSION_BROTLI_LEVEL"] = int(
+        os.getenv("COMPRESSION_BROTLI_LEVEL", "4")
+    )
+    app.config["COMPRESSION_ZSTD_LEVEL"] = int(
+        os.getenv("COMPRESSION_ZSTD_LEVEL", "3")
+    )
+
+    # Query counts and timings per request in a Server-Timing header, see
+    # src/profiler.py. Off by default.
+    app.config["PROFILER_ENABLED"] = (
+        os.getenv("PROFILER_ENABLED", "False").lower() == "true"
+    )
+    app.config["PROFILER_SLOW_QUERY_MS"] = float(
+        os.getenv("PROFILER_SLOW_QUERY_MS", "100")
+    )
+    budget = os.getenv("PROFILER_QUERY_BUDGET")
+    app.config["PROFILER_QUERY_BUDGET"] = int(budget) if budget else None
+
+    # Prometheus metrics at /metrics, see src/metrics.py. Under gunicorn
+    # point METRICS_DIR to a directory emptied on start (e.g. under
+    # /dev/shm) so that every worker's numbers are added up.
+    app.config["METRICS_ENABLED"] = (
+        os.getenv("METRICS_ENABLED", "True").lower() == "true"
+    )
+    app.config["METRICS_DIR"] = os.getenv("METRICS_DIR")
+    app.config["METRICS_FLUSH_INTERVAL"] = float(
+        os.getenv("METRICS_FLUSH_INTERVAL", "1")
+    )
+    # Bearer token required to read /metrics. Without one, metrics are
+    # only served in debug mode.
+    app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN")
+
     if test_config:
         app.config.update(test_config)
 
+    if orjson is not None:
+        app.json = ORJSONProvider(app)
+
+    # First, so that their timings cover the other extensions' hooks
+    profiler.init_app(app)
+    metrics.init_app(app)
     db.init_app(app)
     migrate.init_app(app, db)
-    bcrypt.init_app(app)
     jwt.init_app(app)
+    identity_cache.init_app(app)
+    revocation_store.init_app(app)
+    password_pool.init_app(app)
+    response_cache.init_app(app)
+    compression.init_app(app)
     cors.init_app(
         app,
         origins=app.config["CORS_ORIGINS"],
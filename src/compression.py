@@ -0,0 +1,239 @@
+import threading
+import time
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/html",
+    "text/plain",
+)
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(
+            level, zlib.DEFLATED, zlib.MAX_WBITS | 16
+        )
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Content-Encoding token: (encoder, config key of its level, available)
+ENCODERS = {
+    "zstd": (ZstdEncoder, "COMPRESSION_ZSTD_LEVEL", zstandard is not None),
+    "br": (BrotliEncoder, "COMPRESSION_BROTLI_LEVEL", brotli is not None),
+    "gzip": (GzipEncoder, "COMPRESSION_GZIP_LEVEL", True),
+}
+
+
+def coded_etag(etag: str, coding: str) -> str:
+    """The ETag of the representation compressed with coding"""
+    return f"{etag}-{coding}"
+
+
+def matching_etag(etags, etag: str):
+    """The tag in etags naming the resource version etag, in any content
+    coding, or None.
+
+    Compressed responses carry their own ETag, clients send back
+    whichever one they were given.
+    """
+    if etags.star_tag:
+        return etag
+    codings = {coded_etag(etag, name) for name in ENCODERS}
+    for tag in etags:
+        if tag == etag or tag in codings:
+            return tag
+    return None
+
+
+class Compression:
+    """Compress responses in the encoding the client prefers.
+
+    Encodings are tried in COMPRESSION_ALGORITHMS order and the one with
+    the highest quality in Accept-Encoding wins; zstd and br are skipped
+    when their packages are not installed. Bodies under
+    COMPRESSION_MIN_SIZE are sent as is. Streamed responses are
+    compressed chunk by chunk and flushed after each one, so the client
+    keeps receiving data as it is produced.
+    """
+
+    def __init__(self, app=None):
+        self.algorithms = []
+        self.levels = {}
+        self.min_size = 0
+        self.mimetypes = COMPRESSIBLE_MIMETYPES
+        self._totals = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        algorithms = [
+            name.strip()
+            for name in app.config.setdefault(
+                "COMPRESSION_ALGORITHMS", ["zstd", "br", "gzip"]
+            )
+            if name.strip()
+        ]
+        self.min_size = app.config.setdefault("COMPRESSION_MIN_SIZE", 1024)
+        self.mimetypes = app.config.setdefault(
+            "COMPRESSION_MIMETYPES", COMPRESSIBLE_MIMETYPES
+        )
+        app.config.setdefault("COMPRESSION_GZIP_LEVEL", 6)
+        app.config.setdefault("COMPRESSION_BROTLI_LEVEL", 4)
+        app.config.setdefault("COMPRESSION_ZSTD_LEVEL", 3)
+        unknown = set(algorithms) - set(ENCODERS)
+        if unknown:
+            raise ValueError(
+                f"Unknown COMPRESSION_ALGORITHMS {sorted(unknown)!r}, "
+                f"expected some of {list(ENCODERS)!r}"
+            )
+        self.algorithms = [name for name in algorithms if ENCODERS[name][2]]
+        self.levels = {
+            name: app.config[ENCODERS[name][1]] for name in self.algorithms
+        }
+        self._totals = {
+            name: {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu": 0.0}
+            for name in self.algorithms
+        }
+        app.after_request(self.compress_response)
+        app.extensions["compression"] = self
+
+    def negotiate(self, accept_encodings):
+        """Return the encoding to use, or None for identity"""
+        best, best_quality = None, 0
+        for name in self.algorithms:
+            quality = accept_encodings[name]
+            if quality > best_quality:
+                best, best_quality = name, quality
+        return best
+
+    def compress_response(self, response):
+        if (
+            request.method == "HEAD"
+            or response.mimetype not in self.mimetypes
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or "no-transform" in response.cache_control
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        name = self.negotiate(request.accept_encodings)
+        if name is None:
+            return response
+        encoder = ENCODERS[name][0](self.levels[name])
+        if response.is_streamed:
+            source = response.response
+            response.response = self._stream(
+                name, encoder, response.iter_encoded()
+            )
+            if hasattr(source, "close"):
+                response.call_on_close(source.close)
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                return response
+            started = time.thread_time()
+            data = encoder.compress(body) + encoder.finish()
+            cpu = time.thread_time() - started
+            self._record(name, len(body), len(data), cpu)
+            response.set_data(data)
+        response.headers["Content-Encoding"] = name
+        etag, weak = response.get_etag()
+        if etag:
+            # Each coding is a representation of its own, with its own
+            # strong validator
+            response.set_etag(coded_etag(etag, name), weak)
+        return response
+
+    def _stream(self, name, encoder, chunks):
+        size_in = size_out = 0
+        cpu = 0.0
+        for chunk in chunks:
+            started = time.thread_time()
+            data = encoder.compress(chunk) + encoder.flush()
+            cpu += time.thread_time() - started
+            size_in += len(chunk)
+            size_out += len(data)
+            if data:
+                yield data
+        started = time.thread_time()
+        data = encoder.finish()
+        cpu += time.thread_time() - started
+        self._record(name, size_in, size_out + len(data), cpu)
+        yield data
+
+    def _record(self, name, size_in: int, size_out: int, cpu: float):
+        with self._lock:
+            totals = self._totals[name]
+            totals["responses"] += 1
+            totals["bytes_in"] += size_in
+            totals["bytes_out"] += size_out
+            totals["cpu"] += cpu
+
+    def stats(self):
+        """Bytes saved and CPU seconds spent, per encoding"""
+        with self._lock:
+            return {
+                name: {
+                    "responses": totals["responses"],
+                    "bytes_in": totals["bytes_in"],
+                    "bytes_out": totals["bytes_out"],
+                    "bytes_saved": totals["bytes_in"] - totals["bytes_out"],
+                    "cpu_seconds": totals["cpu"],
+                }
+                for name, totals in self._totals.items()
+            }
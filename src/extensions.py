@@ -1,19 +1,35 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_migrate import Migrate
-from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_babel import Babel
 
+from src.identity_cache import IdentityCache
+from src.revocation_store import RevocationStore
+from src.password_pool import PasswordPool
+from src.response_cache import ResponseCache
+from src.compression import Compression
+from src.profiler import Profiler
+from src.metrics import Metrics
+
 
 class Base(DeclarativeBase):
     pass
 
 
-db = SQLAlchemy(model_class=Base)
+# Sessions only live as long as a request. Write endpoints serialize what
+# they have just committed, and ids and defaults are already known at that
+# point, so expiring would only reload the same values.
+db = SQLAlchemy(model_class=Base, session_options={"expire_on_commit": False})
 migrate = Migrate()
-bcrypt = Bcrypt()
 jwt = JWTManager()
 cors = CORS()
 babel = Babel()
+identity_cache = IdentityCache()
+revocation_store = RevocationStore()
+password_pool = PasswordPool()
+response_cache = ResponseCache()
+compression = Compression()
+profiler = Profiler()
+metrics = Metrics()
@@ -0,0 +1,109 @@
+import bcrypt
+
+try:
+    import argon2
+except ImportError:  # pragma: no cover - optional dependency
+    argon2 = None
+
+
+class BcryptHasher:
+    algorithm = "bcrypt"
+
+    def __init__(self, rounds: int = 12):
+        self.rounds = rounds
+
+    def __repr__(self):
+        return f"BcryptHasher(rounds={self.rounds})"
+
+    def identify(self, password_hash: str) -> bool:
+        return password_hash.startswith(("$2a$", "$2b$", "$2y$"))
+
+    def hash(self, password: str) -> str:
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return bcrypt.checkpw(
+            password.encode("utf-8"), password_hash.encode("utf-8")
+        )
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        # $2b$12$<salt+hash>
+        return int(password_hash.split("$")[2]) != self.rounds
+
+
+class Argon2Hasher:
+    algorithm = "argon2id"
+
+    def __init__(
+        self,
+        time_cost: int = 3,
+        memory_cost: int = 65536,
+        parallelism: int = 4,
+    ):
+        if argon2 is None:
+            raise RuntimeError(
+                "argon2id hashing requires the argon2-cffi package."
+            )
+        self.time_cost = time_cost
+        self.memory_cost = memory_cost
+        self.parallelism = parallelism
+
+    def __repr__(self):
+        return (
+            f"Argon2Hasher(time_cost={self.time_cost}, "
+            f"memory_cost={self.memory_cost}, "
+            f"parallelism={self.parallelism})"
+        )
+
+    def _hasher(self):
+        # Built per call so instances stay picklable for process pools
+        return argon2.PasswordHasher(
+            time_cost=self.time_cost,
+            memory_cost=self.memory_cost,
+            parallelism=self.parallelism,
+            type=argon2.Type.ID,
+        )
+
+    def identify(self, password_hash: str) -> bool:
+        return password_hash.startswith("$argon2")
+
+    def hash(self, password: str) -> str:
+        return self._hasher().hash(password)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        try:
+            return self._hasher().verify(password_hash, password)
+        except (
+            argon2.exceptions.VerificationError,
+            argon2.exceptions.InvalidHashError,
+        ):
+            return False
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        return self._hasher().check_needs_rehash(password_hash)
+
+
+def hashers_from_config(config):
+    """Return the configured hasher followed by the ones kept for verifying
+    hashes stored in an older format.
+    """
+    bcrypt_hasher = BcryptHasher(rounds=config.get("BCRYPT_LOG_ROUNDS", 12))
+    if config.get("PASSWORD_HASHER", "bcrypt") == "bcrypt":
+        hashers = [bcrypt_hasher]
+        if argon2 is not None:
+            hashers.append(Argon2Hasher())
+        return hashers
+    if config["PASSWORD_HASHER"] == "argon2id":
+        return [
+            Argon2Hasher(
+                time_cost=config.get("ARGON2_TIME_COST", 3),
+                memory_cost=config.get("ARGON2_MEMORY_COST", 65536),
+                parallelism=config.get("ARGON2_PARALLELISM", 4),
+            ),
+            bcrypt_hasher,
+        ]
+    raise ValueError(
+        f"Unknown PASSWORD_HASHER {config['PASSWORD_HASHER']!r}, "
+        "expected 'bcrypt' or 'argon2id'"
+    )
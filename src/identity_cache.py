@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdentityCache:
+    """Per-worker TTL/LRU cache of authenticated user rows.
+
+    The JWT blocklist check and the user lookup both need the same
+    ``users`` row. Caching a snapshot of its columns lets both callbacks
+    share one SELECT, and lets later requests skip it entirely until the
+    entry expires or the row is updated.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 0
+        self.max_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.setdefault("IDENTITY_CACHE_TTL", 5)
+        self.max_size = app.config.setdefault("IDENTITY_CACHE_MAX_SIZE", 1024)
+        self.clear()
+        self.hits = self.misses = self.evictions = 0
+        app.extensions["identity_cache"] = self
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, user_id):
+        """Return the cached column snapshot for a user, or None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                expires_at, row = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return row
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def set(self, user_id, row: dict):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, row)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
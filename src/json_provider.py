@@ -0,0 +1,55 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider encoding and decoding with orjson.
+
+    Output is byte for byte what the default provider writes for compact
+    responses: keys sorted, dates through ``default``. Anything else,
+    including indented output, values orjson cannot encode (such as
+    integers over 64 bits or non-string keys) and input it rejects, goes
+    through the standard library. So does text that ``ensure_ascii``
+    would escape, json's C encoder escapes faster than a second pass over
+    orjson's output; set ``app.json.ensure_ascii = False`` to keep it on
+    orjson. Two kinds of float come out differently, and the API writes
+    neither. Floats with an exponent lose their padding (``1e-07``
+    becomes ``1e-7``). NaN and infinities become ``null``, where the
+    standard library writes ``NaN`` and ``Infinity``, which are not JSON.
+    """
+
+    def _options(self):
+        # Non-string keys raise, json.dumps sorts them before converting
+        options = (
+            orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        )
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs != {"separators": (",", ":")}:
+            # Indented output, or the spaced separators json.dumps
+            # defaults to
+            return super().dumps(obj, **kwargs)
+        try:
+            text = orjson.dumps(
+                obj, default=self.default, option=self._options()
+            ).decode("utf-8")
+        except orjson.JSONEncodeError:
+            return super().dumps(obj, **kwargs)
+        if self.ensure_ascii and (not text.isascii() or "\x7f" in text):
+            return super().dumps(obj, **kwargs)
+        return text
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            return super().loads(s)
@@ -0,0 +1,373 @@
+import atexit
+import bisect
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+from http import HTTPStatus
+
+from flask import Response, abort, g, has_app_context, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Family name: (type, help)
+FAMILIES = {
+    "notes_http_requests_total": (
+        "counter",
+        "Requests handled, by endpoint, method and status.",
+    ),
+    "notes_http_request_duration_seconds": (
+        "histogram",
+        "Time taken to build a response, by endpoint and method.",
+    ),
+    "notes_db_pool_size": ("gauge", "Connections the database pool keeps."),
+    "notes_db_pool_checked_out": ("gauge", "Database connections in use."),
+    "notes_db_pool_overflow": (
+        "gauge",
+        "Database connections open beyond the pool size.",
+    ),
+    "notes_password_hash_duration_seconds": (
+        "summary",
+        "Time taken to hash or verify a password, queueing included.",
+    ),
+    "notes_password_pool_in_flight": (
+        "gauge",
+        "Password operations running or queued.",
+    ),
+    "notes_password_pool_rejected_total": (
+        "counter",
+        "Password operations rejected because the pool was full.",
+    ),
+    "notes_cache_hits_total": ("counter", "Cache lookups that hit."),
+    "notes_cache_misses_total": ("counter", "Cache lookups that missed."),
+    "notes_cache_hit_ratio": (
+        "gauge",
+        "Share of cache lookups that hit, across workers.",
+    ),
+    "notes_compression_bytes_in_total": (
+        "counter",
+        "Response bytes before compression, by encoding.",
+    ),
+    "notes_compression_bytes_out_total": (
+        "counter",
+        "Response bytes after compression, by encoding.",
+    ),
+    "notes_compression_cpu_seconds_total": (
+        "counter",
+        "CPU time spent compressing responses, by encoding.",
+    ),
+    "notes_sql_queries_total": (
+        "counter",
+        "SQL statements run while handling requests, when profiling.",
+    ),
+    "notes_sql_slow_queries_total": (
+        "counter",
+        "SQL statements slower than PROFILER_SLOW_QUERY_MS.",
+    ),
+}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _sort_key(item):
+    # Series together, buckets in increasing order before _count and _sum
+    (family, suffix, labels), _ = item
+    bound = dict(labels).get("le")
+    series = tuple(label for label in labels if label[0] != "le")
+    return family, series, suffix != "_bucket", suffix, float(bound or 0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+class Metrics:
+    """Prometheus metrics served at /metrics.
+
+    Request counts and latency histograms are kept in memory by each
+    worker, other values are read from the extensions' stats() when
+    collected. With METRICS_DIR set, each worker writes its samples to
+    ``<pid>.json`` there at most every METRICS_FLUSH_INTERVAL seconds and
+    /metrics adds up the files of every worker, so whichever worker
+    answers the scrape reports the whole node. Counters of workers that
+    have exited are kept, their gauges are dropped. Empty the directory
+    when the server starts, as with prometheus_client's multiprocess
+    mode.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.directory = None
+        self.flush_interval = 1.0
+        self.buckets = DEFAULT_BUCKETS
+        self.token = None
+        self._extensions = {}
+        self._counters = {}
+        self._histograms = {}
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.setdefault("METRICS_ENABLED", True)
+        self.directory = app.config.setdefault("METRICS_DIR", None)
+        self.flush_interval = app.config.setdefault(
+            "METRICS_FLUSH_INTERVAL", 1.0
+        )
+        self.buckets = tuple(
+            sorted(app.config.setdefault("METRICS_BUCKETS", DEFAULT_BUCKETS))
+        )
+        self.token = app.config.setdefault("METRICS_TOKEN", None)
+        if self.enabled and not self.token and not (app.debug or app.testing):
+            # Open to anyone who asks only while developing
+            app.logger.warning(
+                "Metrics are disabled: set METRICS_TOKEN to serve /metrics "
+                "outside debug mode"
+            )
+            self.enabled = False
+        self._extensions = app.extensions
+        self.clear()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        if self.enabled and "metrics" not in app.extensions:
+            app.before_request(self.start_request)
+            app.after_request(self.finish_request)
+            app.add_url_rule("/metrics", "metrics", self.serve)
+            atexit.register(self.flush)
+        app.extensions["metrics"] = self
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def start_request(self):
+        g.metrics_started = time.perf_counter()
+
+    def finish_request(self, response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        # Unmatched URLs share one label instead of one per path
+        endpoint = request.endpoint or "unmatched"
+        labels = (("endpoint", endpoint), ("method", request.method))
+        key = (*labels, ("status", str(response.status_code)))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            histogram = self._histograms.get(labels)
+            if histogram is None:
+                histogram = self._histograms[labels] = [0] * (
+                    len(self.buckets) + 2
+                )
+            histogram[bisect.bisect_left(self.buckets, elapsed)] += 1
+            histogram[-1] += elapsed
+        if (
+            self.directory
+            and time.monotonic() - self._flushed_at >= self.flush_interval
+        ):
+            self.flush()
+        return response
+
+    def collect(self):
+        """This worker's samples, as (family, suffix, labels, value)"""
+        samples = []
+        with self._lock:
+            for labels, value in self._counters.items():
+                samples.append(
+                    ("notes_http_requests_total", "", labels, value)
+                )
+            for labels, histogram in self._histograms.items():
+                family = "notes_http_request_duration_seconds"
+                cumulative = 0
+                bounds = [str(float(bound)) for bound in self.buckets]
+                for bound, count in zip([*bounds, "+Inf"], histogram):
+                    cumulative += count
+                    samples.append(
+                        (
+                            family,
+                            "_bucket",
+                            (*labels, ("le", bound)),
+                            cumulative,
+                        )
+                    )
+                samples.append((family, "_sum", labels, histogram[-1]))
+                samples.append((family, "_count", labels, cumulative))
+        samples.extend(self._collect_extensions())
+        return samples
+
+    def _collect_extensions(self):
+        samples = []
+        extensions = self._extensions
+        sqlalchemy = extensions.get("sqlalchemy")
+        if sqlalchemy is not None and has_app_context():
+            pool = sqlalchemy.engine.pool
+            for family, method in (
+                ("notes_db_pool_size", "size"),
+                ("notes_db_pool_checked_out", "checkedout"),
+                ("notes_db_pool_overflow", "overflow"),
+            ):
+                if callable(getattr(pool, method, None)):
+                    samples.append((family, "", (), getattr(pool, method)()))
+        password_pool = extensions.get("password_pool")
+        if password_pool is not None:
+            stats = password_pool.stats()
+            family = "notes_password_hash_duration_seconds"
+            samples += [
+                (family, "_sum", (), stats["latency_total"]),
+                (family, "_count", (), stats["completed"]),
+                ("notes_password_pool_in_flight", "", (), stats["in_flight"]),
+                (
+                    "notes_password_pool_rejected_total",
+                    "",
+                    (),
+                    stats["rejected"],
+                ),
+            ]
+        for name in ("identity_cache", "response_cache"):
+            cache = extensions.get(name)
+            if cache is not None:
+                stats = cache.stats()
+                labels = (("cache", name),)
+                samples += [
+                    ("notes_cache_hits_total", "", labels, stats["hits"]),
+                    ("notes_cache_misses_total", "", labels, stats["misses"]),
+                ]
+        compression = extensions.get("compression")
+        if compression is not None:
+            for encoding, stats in compression.stats().items():
+                labels = (("encoding", encoding),)
+                samples += [
+                    (
+                        "notes_compression_bytes_in_total",
+                        "",
+                        labels,
+                        stats["bytes_in"],
+                    ),
+                    (
+                        "notes_compression_bytes_out_total",
+                        "",
+                        labels,
+                        stats["bytes_out"],
+                    ),
+                    (
+                        "notes_compression_cpu_seconds_total",
+                        "",
+                        labels,
+                        stats["cpu_seconds"],
+                    ),
+                ]
+        profiler = extensions.get("profiler")
+        if profiler is not None and profiler.enabled:
+            stats = profiler.stats()
+            samples += [
+                ("notes_sql_queries_total", "", (), stats["queries"]),
+                (
+                    "notes_sql_slow_queries_total",
+                    "",
+                    (),
+                    stats["slow_queries"],
+                ),
+            ]
+        return samples
+
+    def flush(self, samples=None):
+        """Write this worker's samples to METRICS_DIR"""
+        if not self.directory:
+            return
+        if samples is None:
+            samples = self.collect()
+        pid = os.getpid()
+        path = os.path.join(self.directory, f"{pid}.json")
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({"pid": pid, "samples": samples}, file)
+        os.replace(temporary, path)
+        self._flushed_at = time.monotonic()
+
+    def aggregate(self):
+        """Samples of every worker, added up"""
+        samples = self.collect()
+        if not self.directory:
+            snapshots = [{"pid": os.getpid(), "samples": samples}]
+        else:
+            self.flush(samples)
+            snapshots = []
+            for path in glob.glob(os.path.join(self.directory, "*.json")):
+                try:
+                    with open(path) as file:
+                        snapshots.append(json.load(file))
+                except (OSError, ValueError):
+                    # Removed or being replaced, counted next scrape
+                    continue
+        totals = {}
+        for snapshot in snapshots:
+            alive = _pid_alive(snapshot["pid"])
+            for family, suffix, labels, value in snapshot["samples"]:
+                if FAMILIES[family][0] == "gauge" and not alive:
+                    continue
+                key = (family, suffix, tuple(map(tuple, labels)))
+                totals[key] = totals.get(key, 0) + value
+        # Ratios are only meaningful once every worker is added up
+        for (family, _, labels), hits in list(totals.items()):
+            if family == "notes_cache_hits_total":
+                misses = totals.get(("notes_cache_misses_total", "", labels))
+                lookups = hits + (misses or 0)
+                totals[("notes_cache_hit_ratio", "", labels)] = (
+                    hits / lookups if lookups else 0.0
+                )
+        return totals
+
+    def render(self) -> str:
+        """The Prometheus text exposition of aggregate()"""
+        by_family = {}
+        for (family, suffix, labels), value in sorted(
+            self.aggregate().items(), key=_sort_key
+        ):
+            by_family.setdefault(family, []).append((suffix, labels, value))
+        lines = []
+        for family, samples in by_family.items():
+            kind, help_text = FAMILIES[family]
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(
+                    f"{family}{suffix}{_format_labels(labels)} {value}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def serve(self):
+        # Compared in constant time, as bytes since the header may hold
+        # anything
+        if self.token and not hmac.compare_digest(
+            request.headers.get("Authorization", "").encode("utf-8"),
+            f"Bearer {self.token}".encode("utf-8"),
+        ):
+            abort(HTTPStatus.UNAUTHORIZED)
+        return Response(
+            self.render(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
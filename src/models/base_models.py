@@ -1,13 +1,101 @@
 from datetime import datetime, timezone
 from typing import Optional
 from sqlalchemy.sql import func
-from sqlalchemy import select
+from sqlalchemy import (
+    inspect,
+    select,
+    table,
+    column,
+    literal_column,
+    tuple_,
+    update,
+)
 from src.extensions import db
 from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.orm.util import identity_key
 from sqlalchemy import DateTime, Integer
 from flask_smorest import abort
 
 
+def utcnow() -> datetime:
+    """The current UTC time, naive like the values the DateTime columns
+    read back, so that a row serializes the same before and after a
+    reload."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def apply_keyset(stmt, sort_key, id_column, cursor_key, cursor_id, direction):
+    """Restrict stmt to rows after a (sort_key, id) cursor and order it.
+
+    Pages run in descending order; ``direction="prev"`` reads the rows
+    before the cursor in ascending order, so callers reverse them. Row
+    value comparisons keep each page a single index range scan.
+    """
+    backwards = direction == "prev"
+    if cursor_key is not None and cursor_id:
+        position = tuple_(sort_key, id_column)
+        cursor = tuple_(cursor_key, cursor_id)
+        stmt = stmt.where(
+            position > cursor if backwards else position < cursor
+        )
+    elif cursor_key is not None:
+        stmt = stmt.where(
+            sort_key > cursor_key if backwards else sort_key < cursor_key
+        )
+    if backwards:
+        return stmt.order_by(sort_key.asc(), id_column.asc())
+    return stmt.order_by(sort_key.desc(), id_column.desc())
+
+
+def lock_rows(stmt, model):
+    """Lock the rows of model that stmt selects until the transaction
+    ends.
+
+    Their columns are read over any values the session already holds,
+    so checks made once the lock is held see the latest committed write.
+    Only model's table is locked, not the tables stmt joins.
+    """
+    return stmt.with_for_update(of=model).execution_options(
+        populate_existing=True
+    )
+
+
+class Record:
+    """Read-only row of a projection query.
+
+    Reads like the entity it stands for, attribute by attribute, but is a
+    plain ``__slots__`` object with no identity map entry, change
+    tracking or lazy loading, which is all a list that is only serialized
+    needs. Subclasses list every attribute a projection may set;
+    attributes a query did not select are missing rather than None.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **attributes):
+        for name, value in attributes.items():
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {getattr(self, 'id', None)}>"
+
+    @classmethod
+    def from_rows(cls, result):
+        """One record per row of result, attributes named after its
+        columns"""
+        keys = tuple(result.keys())
+        new = object.__new__
+        records = []
+        for row in result:
+            record = new(cls)
+            for key, value in zip(keys, row):
+                setattr(record, key, value)
+            records.append(record)
+        return records
+
+
 class BaseModel(db.Model):
     __abstract__ = True
 
@@ -24,19 +112,84 @@ class BaseModel(db.Model):
     @classmethod
     def create(cls, data, commit: bool = False):
         instance = cls(**data)
+        # A new row has no children yet, nothing to lazy load once it is
+        # serialized
+        for relationship in inspect(cls).relationships:
+            if relationship.uselist and relationship.key not in data:
+                set_committed_value(instance, relationship.key, [])
+        # Parents already in the session list it among their children
+        instance._sync_references(data, load=False)
         db.session.add(instance)
         if commit:
             db.session.commit()
         return instance
 
+    @classmethod
+    def contains(cls, attr, value: str):
+        """Case-insensitive substring match on a trigram indexed column.
+
+        Postgres serves the ILIKE from a pg_trgm GIN index. SQLite looks
+        the ids up in the ``<table>_<column>_trgm`` FTS5 trigram table;
+        values shorter than a trigram fall back to a plain ILIKE.
+        """
+        if db.session.get_bind().dialect.name != "sqlite" or len(value) < 3:
+            escaped = (
+                value.replace("\\", "\\\\")
+                .replace("%", "\\%")
+                .replace("_", "\\_")
+            )
+            return attr.ilike(f"%{escaped}%", escape="\\")
+        name = f"{cls.__tablename__}_{attr.key}_trgm"
+        trigrams = table(name, column("rowid"))
+        phrase = '"{}"'.format(value.replace('"', '""'))
+        return cls.id.in_(
+            select(trigrams.c.rowid).where(literal_column(name).match(phrase))
+        )
+
     def update(self, data: dict, commit: bool = False):
         for key, value in data.items():
             if hasattr(self, key):
                 setattr(self, key, value)
+        self._sync_references(data)
         if commit:
             db.session.commit()
         return self
 
+    def _sync_references(self, data: dict, load: bool = True):
+        """Point many-to-one relationships at the rows their updated
+        foreign keys reference.
+
+        Commits do not expire instances, so a relationship loaded before
+        its foreign key changed would otherwise still be serialized, and
+        so would the collections of the old and new parents; assigning
+        the relationship updates those through their backrefs. The
+        referenced row is usually in the session already; unless load is
+        set, rows that are not are left alone.
+        """
+        for relationship in inspect(type(self)).relationships:
+            if relationship.direction is not MANYTOONE:
+                continue
+            (column,) = relationship.local_columns
+            if column.key not in data:
+                continue
+            value = data[column.key]
+            target_class = relationship.mapper.class_
+            if value is None:
+                target = None
+            elif load:
+                target = db.session.get(target_class, value)
+            else:
+                target = db.session.identity_map.get(
+                    identity_key(target_class, value)
+                )
+                if target is None:
+                    continue
+            if value is not None and target is None:
+                # Left for the database to reject
+                db.session.expire(self, [relationship.key])
+            else:
+                setattr(self, relationship.key, target)
+
 
 class CreateUpdateModel(BaseModel):
     __abstract__ = True
@@ -44,17 +197,36 @@ class CreateUpdateModel(BaseModel):
     created_at: Mapped[datetime] = mapped_column(
         DateTime,
         nullable=False,
-        default=datetime.now(timezone.utc),
+        default=utcnow,
         server_default=func.now(),
     )
+    # Evaluated on every write, ETags are derived from it
     updated_at: Mapped[datetime] = mapped_column(
         DateTime,
         nullable=False,
-        default=datetime.now(timezone.utc),
+        default=utcnow,
         server_default=func.now(),
-        onupdate=datetime.now(timezone.utc),
+        onupdate=utcnow,
     )
 
+    @classmethod
+    def change_stamp(cls, *criteria):
+        """Scalar subqueries for the number of rows matching criteria and
+        their latest ``updated_at``, deleted rows included.
+
+        Any create, update or soft delete of those rows changes one of the
+        two, so they version a resource without loading it.
+        """
+        return (
+            select(func.count())
+            .select_from(cls)
+            .where(*criteria)
+            .scalar_subquery(),
+            select(func.max(cls.updated_at))
+            .where(*criteria)
+            .scalar_subquery(),
+        )
+
 
 class SoftDeleteModel(BaseModel):
     __abstract__ = True
@@ -64,10 +236,39 @@ class SoftDeleteModel(BaseModel):
     )
 
     def soft_delete(self, commit: bool = False):
-        self.deleted_at = datetime.now(timezone.utc)
+        self.deleted_at = utcnow()
         if commit:
             db.session.commit()
 
+    @classmethod
+    def bulk_update(cls, values: dict, *criteria, include_deleted=False):
+        """Apply values to every row matching criteria in one UPDATE.
+
+        Unlike loading the rows and calling ``update`` on each, nothing is
+        loaded; objects already in the session are kept in sync. Returns
+        the number of rows matched. Commit is left to the caller so that
+        cascades can share a transaction.
+        """
+        stmt = update(cls).where(*criteria).values(values)
+        if not include_deleted:
+            stmt = stmt.where(cls.deleted_at.is_(None))
+        return db.session.execute(stmt).rowcount
+
+    @classmethod
+    def bulk_soft_delete(cls, *criteria):
+        """Soft delete every active row matching criteria in one UPDATE"""
+        return cls.bulk_update({"deleted_at": utcnow()}, *criteria)
+
+    @classmethod
+    def count_active(cls, *criteria):
+        """Count active rows matching criteria without loading them"""
+        stmt = (
+            select(func.count())
+            .select_from(cls)
+            .where(cls.deleted_at.is_(None), *criteria)
+        )
+        return db.session.execute(stmt).scalar_one()
+
     @classmethod
     def select_active(cls):
         """Select statement for only non-deleted records"""
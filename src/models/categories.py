@@ -1,19 +1,33 @@
-from src.models.base_models import CreateUpdateModel, SoftDeleteModel
-from sqlalchemy import ForeignKey, Integer, String
+from src.models.base_models import (
+    CreateUpdateModel,
+    Record,
+    SoftDeleteModel,
+    apply_keyset,
+    lock_rows,
+)
+from sqlalchemy import ForeignKey, Integer, String, func, select, text
 from src.extensions import db
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import (
+    Mapped,
+    mapped_column,
+    relationship,
+    selectinload,
+)
 from flask_smorest import abort
-from typing import TYPE_CHECKING, Optional
+from typing import Optional
+from datetime import datetime
 
 from src.models.users import User
-
-if TYPE_CHECKING:
-    from src.models.notes import Note
+from src.models.notes import Note, NoteRecord
 
 
 class Category(CreateUpdateModel, SoftDeleteModel):
     __tablename__ = "categories"
-    __table_args__ = (db.Index("idx_name", "name"),)
+    __table_args__ = (
+        # Serves the change_stamp queries behind ETags
+        db.Index("idx_categories_user_updated_at", "user_id", "updated_at"),
+        db.Index("idx_name", "name"),
+    )
     user_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("users.id"), nullable=False
     )
@@ -26,27 +40,54 @@ class Category(CreateUpdateModel, SoftDeleteModel):
     user: Mapped["User"] = relationship(back_populates="categories")
     notes: Mapped[list["Note"]] = relationship(back_populates="category")
 
+    # Set by with_note_previews for the list endpoint
+    note_count = None
+    note_previews = None
+
     @classmethod
     def find_category_by_user_and_id(
-        cls, user_id: int, id: int, include_deleted: bool = False
+        cls,
+        user_id: int,
+        id: int,
+        include_deleted: bool = False,
+        for_update: bool = False,
     ):
-        user = User.get_by_id(user_id)
-        if user is None:
-            return None
         stmt = (
             cls.select_with_deleted()
             if include_deleted
             else cls.select_active()
         )
-        stmt = stmt.where(cls.user_id == user_id, cls.id == id)
+        # The owner is checked in the same query
+        stmt = stmt.join(cls.user).where(
+            *User.active_criteria(), cls.user_id == user_id, cls.id == id
+        )
+        if for_update:
+            stmt = lock_rows(stmt, cls)
         return db.session.execute(stmt).scalar_one_or_none()
 
+    @classmethod
+    def find_categories_by_user_and_ids(cls, user_id: int, ids):
+        """Return the user's active categories among ids, keyed by id"""
+        if not ids:
+            return {}
+        stmt = cls.select_active().where(
+            cls.user_id == user_id, cls.id.in_(ids)
+        )
+        return {
+            category.id: category
+            for category in db.session.scalars(stmt).all()
+        }
+
     @classmethod
     def find_category_by_user_and_id_or_404(
-        cls, user_id: int, id: int, include_deleted: bool = False
+        cls,
+        user_id: int,
+        id: int,
+        include_deleted: bool = False,
+        for_update: bool = False,
     ):
         result = cls.find_category_by_user_and_id(
-            user_id, id, include_deleted=include_deleted
+            user_id, id, include_deleted=include_deleted, for_update=for_update
         )
         if result is None:
             abort(404)
@@ -58,13 +99,126 @@ class Category(CreateUpdateModel, SoftDeleteModel):
         user_id: int,
         include_deleted: bool = False,
         name: Optional[str] = None,
+        cursor_created_at: Optional[datetime] = None,
+        cursor_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        direction: str = "next",
+        read_only: bool = False,
+        with_notes: bool = False,
     ):
-        stmt = (
-            cls.select_active()
-            if not include_deleted
-            else cls.select_with_deleted()
-        )
+        """Return a page of categories, in descending order even when
+        paging backwards.
+
+        With read_only the categories are CategoryRecords, for pages that
+        are only serialized. with_notes loads the notes of every category
+        in one more query, for entities.
+        """
+        if read_only:
+            stmt = select(*cls.__table__.columns)
+            if not include_deleted:
+                stmt = stmt.where(cls.deleted_at.is_(None))
+        else:
+            stmt = (
+                cls.select_active()
+                if not include_deleted
+                else cls.select_with_deleted()
+            )
+            if with_notes:
+                stmt = stmt.options(
+                    selectinload(cls.notes).load_only(Note.id, Note.title)
+                )
         stmt = stmt.where(cls.user_id == user_id)
         if name:
-            stmt = stmt.where(cls.name.ilike(f"%{name}%"))
-        return db.session.scalars(stmt.order_by(cls.created_at.desc())).all()
+            stmt = stmt.where(cls.contains(cls.name, name))
+        stmt = apply_keyset(
+            stmt,
+            cls.created_at,
+            cls.id,
+            cursor_created_at,
+            cursor_id,
+            direction,
+        )
+        stmt = stmt.limit(limit)
+        if read_only:
+            categories = CategoryRecord.from_rows(db.session.execute(stmt))
+        else:
+            categories = db.session.scalars(stmt).all()
+        if direction == "prev":
+            categories.reverse()
+        return categories
+
+    @classmethod
+    def with_note_previews(cls, categories, limit: int):
+        """Set note_count and up to limit most recent note_previews on
+        each category.
+
+        Counts and previews come from one windowed query, so only the
+        previews are loaded however many notes the categories hold.
+        """
+        if not categories:
+            return categories
+        ranked = (
+            select(
+                Note.id,
+                Note.title,
+                Note.created_at,
+                Note.category_id,
+                func.row_number()
+                .over(
+                    partition_by=Note.category_id,
+                    order_by=(Note.created_at.desc(), Note.id.desc()),
+                )
+                .label("position"),
+                func.count()
+                .over(partition_by=Note.category_id)
+                .label("note_count"),
+            )
+            .where(
+                Note.category_id.in_([c.id for c in categories]),
+                Note.deleted_at.is_(None),
+            )
+            .subquery()
+        )
+        # Always keep the first row, it carries the count
+        rows = db.session.execute(
+            select(ranked)
+            .where(ranked.c.position <= max(limit, 1))
+            .order_by(ranked.c.category_id, ranked.c.position)
+        ).all()
+        for category in categories:
+            category.note_count = 0
+            category.note_previews = []
+        by_id = {category.id: category for category in categories}
+        for row in rows:
+            category = by_id[row.category_id]
+            category.note_count = row.note_count
+            if row.position <= limit:
+                category.note_previews.append(
+                    NoteRecord(
+                        id=row.id, title=row.title, created_at=row.created_at
+                    )
+                )
+        return categories
+
+
+# Matches the keyset query of Category.filter. Ordered columns rather than
+# text() so that autogenerate compares it equal to the migrated index.
+db.Index(
+    "idx_categories_user_list",
+    Category.user_id,
+    Category.created_at.desc(),
+    Category.id.desc(),
+    postgresql_where=text("deleted_at IS NULL"),
+    sqlite_where=text("deleted_at IS NULL"),
+)
+
+
+class CategoryRecord(Record):
+    """A category read by a read-only Category.filter, or the category of
+    a NoteRecord"""
+
+    __slots__ = (
+        *Category.__table__.columns.keys(),
+        "note_count",
+        "note_previews",
+    )
@@ -1,12 +1,37 @@
-from sqlalchemy import or_, and_
+from sqlalchemy import (
+    column,
+    func,
+    insert,
+    literal_column,
+    select,
+    table,
+    text,
+)
+from flask_babel import gettext
 from flask_smorest import abort
+from http import HTTPStatus
 from datetime import datetime
 from typing import Optional
 
 from src.extensions import db
-from src.models.base_models import CreateUpdateModel, SoftDeleteModel
+from src.models.base_models import (
+    CreateUpdateModel,
+    Record,
+    SoftDeleteModel,
+    apply_keyset,
+    lock_rows,
+)
+from src.streaming import UploadError
 from sqlalchemy import Integer, String, Text, ForeignKey, Boolean
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import (
+    Mapped,
+    joinedload,
+    load_only,
+    mapped_column,
+    query_expression,
+    relationship,
+    with_expression,
+)
 
 from src.models.users import User
 
@@ -18,7 +43,11 @@ if TYPE_CHECKING:
 
 class Note(CreateUpdateModel, SoftDeleteModel):
     __tablename__ = "notes"
-    __table_args__ = (db.Index("idx_created_at_id", "created_at", "id"),)
+    __table_args__ = (
+        # Serves the change_stamp queries behind ETags
+        db.Index("idx_notes_user_updated_at", "user_id", "updated_at"),
+        db.Index("idx_created_at_id", "created_at", "id"),
+    )
     user_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("users.id"), nullable=False
     )
@@ -37,40 +66,165 @@ class Note(CreateUpdateModel, SoftDeleteModel):
     category: Mapped[Optional["Category"]] = relationship(
         back_populates="notes"
     )
+    # Start of the content, computed in SQL when load_fields asks for it
+    excerpt: Mapped[Optional[str]] = query_expression()
+
+    @classmethod
+    def load_fields(cls, fields=None, excerpt_length: int = 200):
+        """Loader options reading only what fields need.
+
+        ``fields`` are NoteSchema field names, None loads whole notes with
+        their category. Otherwise unlisted columns are never selected, the
+        category is joined only when listed and ``excerpt`` holds the first
+        excerpt_length characters of the content.
+        """
+        if fields is None:
+            return [joinedload(cls.category)]
+        from src.models.categories import Category
+
+        # id and created_at locate the note in pagination cursors
+        columns = {"id", "created_at"}
+        columns.update(
+            name for name in fields if name in cls.__table__.columns
+        )
+        options = [load_only(*(getattr(cls, name) for name in columns))]
+        if "category" in fields:
+            options.append(
+                joinedload(cls.category).load_only(Category.id, Category.name)
+            )
+        if "excerpt" in fields:
+            options.append(
+                with_expression(
+                    cls.excerpt, func.substr(cls.content, 1, excerpt_length)
+                )
+            )
+        return options
+
+    @classmethod
+    def record_columns(cls, fields=None, excerpt_length: int = 200):
+        """Columns a read-only query selects for fields, as load_fields
+        loads them.
+
+        The category is read as ``category_name`` from an outer join,
+        NoteRecord.attach_categories turns it into ``category``.
+        """
+        from src.models.categories import Category
+
+        wanted = set((*NOTE_COLUMNS, "category") if fields is None else fields)
+        wanted.update(("id", "created_at"))
+        if "category" in wanted:
+            wanted.add("category_id")
+        columns = [
+            column for column in cls.__table__.columns if column.key in wanted
+        ]
+        if "category" in wanted:
+            columns.append(Category.name.label("category_name"))
+        if "excerpt" in wanted:
+            columns.append(
+                func.substr(cls.content, 1, excerpt_length).label("excerpt")
+            )
+        return columns
 
     @classmethod
     def find_note_by_user_and_id(
-        cls, user_id, id, include_deleted: bool = False
+        cls,
+        user_id,
+        id,
+        include_deleted: bool = False,
+        only=None,
+        excerpt_length: int = 200,
+        for_update: bool = False,
     ):
-        user = User.get_by_id(user_id)
-        if user is None:
-            return None
         stmt = (
             cls.select_with_deleted()
             if include_deleted
             else cls.select_active()
         )
-        stmt = stmt.where(cls.user_id == user_id, cls.id == id)
+        # The owner is checked in the same query
+        stmt = (
+            stmt.join(cls.user)
+            .where(
+                *User.active_criteria(), cls.user_id == user_id, cls.id == id
+            )
+            .options(*cls.load_fields(only, excerpt_length))
+        )
+        if for_update:
+            stmt = lock_rows(stmt, cls)
         return db.session.execute(stmt).scalar_one_or_none()
 
     @classmethod
     def find_note_by_user_and_id_or_404(
-        cls, user_id, id, include_deleted: bool = False
+        cls,
+        user_id,
+        id,
+        include_deleted: bool = False,
+        only=None,
+        excerpt_length: int = 200,
+        for_update: bool = False,
     ):
-        User.get_or_404(user_id)
-        stmt = (
-            cls.select_with_deleted()
-            if include_deleted
-            else cls.select_active()
+        result = cls.find_note_by_user_and_id(
+            user_id,
+            id,
+            include_deleted=include_deleted,
+            only=only,
+            excerpt_length=excerpt_length,
+            for_update=for_update,
         )
-        stmt = stmt.where(cls.user_id == user_id, cls.id == id)
-        result = db.session.execute(stmt).scalar_one_or_none()
         if result is None:
             abort(404)
         return result
 
+    # Set on notes returned by a search, used as the pagination cursor
+    search_rank = None
+
+    @classmethod
+    def _apply_search(cls, stmt, search: str):
+        """Restrict stmt to notes whose title or content match search.
+
+        Returns the statement and a rank expression, higher is better.
+        """
+        if db.session.get_bind().dialect.name == "postgresql":
+            query = func.websearch_to_tsquery("simple", search)
+            vector = literal_column("notes.search_vector")
+            stmt = stmt.where(vector.op("@@")(query))
+            return stmt, func.ts_rank(vector, query)
+        # SQLite FTS5, quote each term so input is never FTS5 syntax
+        terms = " ".join(
+            '"{}"'.format(term.replace('"', '""')) for term in search.split()
+        )
+        fts = table("notes_fts", column("rowid"), column("rank"))
+        stmt = stmt.join(fts, fts.c.rowid == cls.id).where(
+            literal_column("notes_fts").match(terms)
+        )
+        # bm25 rank is lower for better matches
+        return stmt, -fts.c.rank
+
+    @classmethod
+    def filter_criteria(
+        cls,
+        user_id: int,
+        title: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        archived: Optional[bool] = False,
+        category_id: Optional[int] = None,
+    ):
+        """WHERE clauses shared by the note list and mass operations"""
+        criteria = [cls.user_id == user_id]
+        if title:
+            criteria.append(cls.contains(cls.title, title))
+        if start_date:
+            criteria.append(cls.created_at >= start_date)
+        if end_date:
+            criteria.append(cls.created_at <= end_date)
+        if archived is not None:
+            criteria.append(cls.archived.is_(archived))
+        if category_id is not None:
+            criteria.append(cls.category_id == category_id)
+        return criteria
+
     @classmethod
-    def filter(
+    def select_filtered(
         cls,
         user_id: int,
         title: Optional[str] = None,
@@ -81,36 +235,294 @@ class Note(CreateUpdateModel, SoftDeleteModel):
         end_date: Optional[datetime] = None,
         archived: bool = False,
         category_id: Optional[int] = None,
+        search: Optional[str] = None,
+        cursor_rank: Optional[float] = None,
+        direction: str = "next",
+        only: Optional[list] = None,
+        excerpt_length: int = 200,
+        read_only: bool = False,
     ):
-        stmt = cls.select_active().where(cls.user_id == user_id)
-        if cursor_id and cursor_created_at:
-            stmt = stmt.where(
-                or_(
-                    Note.created_at < cursor_created_at,
-                    and_(
-                        Note.created_at == cursor_created_at,
-                        Note.id < cursor_id,
-                    ),
+        # The category is serialized with every note, read it in the same
+        # query rather than once per note
+        if read_only:
+            columns = cls.record_columns(only, excerpt_length)
+            stmt = select(*columns).where(cls.deleted_at.is_(None))
+            if any(column.key == "category_name" for column in columns):
+                stmt = stmt.outerjoin(cls.category)
+        else:
+            stmt = cls.select_active().options(
+                *cls.load_fields(only, excerpt_length)
+            )
+        stmt = stmt.where(
+            *cls.filter_criteria(
+                user_id,
+                title=title,
+                start_date=start_date,
+                end_date=end_date,
+                archived=archived,
+                category_id=category_id,
+            )
+        )
+        if search:
+            stmt, sort_key = cls._apply_search(stmt, search)
+            cursor_key = cursor_rank
+        else:
+            sort_key = Note.created_at
+            cursor_key = cursor_created_at
+        if search:
+            stmt = stmt.add_columns(sort_key.label("search_rank"))
+        # Matches idx_notes_user_list / idx_notes_user_category_list
+        return apply_keyset(
+            stmt,
+            sort_key,
+            Note.id,
+            cursor_key,
+            cursor_id,
+            direction,
+        ).limit(limit)
+
+    @classmethod
+    def filter(cls, user_id: int, read_only: bool = False, **filters):
+        """Return a page of notes, in descending order even when paging
+        backwards.
+
+        With read_only the notes are NoteRecords, for pages that are only
+        serialized.
+        """
+        stmt = cls.select_filtered(user_id, read_only=read_only, **filters)
+        if read_only:
+            notes = NoteRecord.attach_categories(
+                NoteRecord.from_rows(db.session.execute(stmt))
+            )
+        elif filters.get("search"):
+            rows = db.session.execute(stmt).all()
+            for note, note_rank in rows:
+                note.search_rank = note_rank
+            notes = [note for note, _ in rows]
+        else:
+            notes = db.session.scalars(stmt).all()
+        if filters.get("direction") == "prev":
+            notes.reverse()
+        return notes
+
+    @classmethod
+    def export_rows(cls, user_id: int, batch_size: int = 1000, **filters):
+        """Yield (id, title, content, archived, category_id, category_name,
+        created_at, updated_at) for every note matching filters.
+
+        Rows are plain tuples read from a server-side cursor batch_size at
+        a time, so memory does not grow with the number of notes.
+        """
+        from src.models.categories import Category
+
+        stmt = (
+            select(
+                cls.id,
+                cls.title,
+                cls.content,
+                cls.archived,
+                cls.category_id,
+                Category.name,
+                cls.created_at,
+                cls.updated_at,
+            )
+            .outerjoin(cls.category)
+            .where(
+                cls.deleted_at.is_(None),
+                *cls.filter_criteria(user_id, **filters),
+            )
+            .order_by(cls.id)
+            .execution_options(yield_per=batch_size)
+        )
+        with db.session.execute(stmt) as result:
+            yield from result
+
+    @classmethod
+    def import_records(cls, user_id: int, records, batch_size: int = 1000):
+        """Insert validated notes, yielding progress as it goes.
+
+        ``records`` yields (line, data, errors); rows with errors are
+        reported and skipped. ``category_name`` is resolved against the
+        user's categories, creating missing ones. Notes are written with
+        multi-row INSERTs and committed every batch_size rows, yielding
+        ``{"imported", "failed"}`` after each commit, ``{"line",
+        "errors"}`` for each rejected row and a last event with
+        ``"done": True``. If the upload cannot be read to the end, the
+        batch in progress is rolled back and the last event has an
+        ``"error"`` instead, ``"imported"`` counting the rows committed.
+        """
+        from src.models.categories import Category
+
+        category_ids = {
+            category.name: category.id
+            for category in db.session.scalars(
+                Category.select_active().where(Category.user_id == user_id)
+            )
+        }
+        batch = []
+        imported = failed = 0
+
+        def write():
+            if batch:
+                db.session.execute(insert(cls), batch)
+            db.session.commit()
+            batch.clear()
+
+        try:
+            for line, data, errors in records:
+                if errors:
+                    failed += 1
+                    yield {"line": line, "errors": errors}
+                    continue
+                name = data.pop("category_name", None)
+                if name is not None and name not in category_ids:
+                    category = Category.create(
+                        {"user_id": user_id, "name": name}
+                    )
+                    db.session.flush()
+                    category_ids[name] = category.id
+                batch.append(
+                    {
+                        **data,
+                        "user_id": user_id,
+                        "category_id": category_ids.get(name),
+                    }
                 )
+                if len(batch) >= batch_size:
+                    imported += len(batch)
+                    write()
+                    yield {"imported": imported, "failed": failed}
+        except UploadError as err:
+            # Categories created for the dropped rows go with them
+            db.session.rollback()
+            yield {"imported": imported, "failed": failed, "error": str(err)}
+            return
+        imported += len(batch)
+        write()
+        yield {"imported": imported, "failed": failed, "done": True}
+
+    @classmethod
+    def apply_batch(cls, user_id: int, operations, category_ids):
+        """Apply create/update/delete/restore operations in order.
+
+        ``category_ids`` are the categories the user may assign. All
+        notes the operations refer to are loaded in one query and the
+        changes are flushed together, creates as a multi-row INSERT where
+        the dialect supports it.
+        Returns a result per operation; a failed operation does not stop
+        the others. Commit is left to the caller.
+        """
+        ids = {op["id"] for op in operations if "id" in op}
+        notes = {}
+        if ids:
+            stmt = (
+                cls.select_with_deleted()
+                .where(cls.user_id == user_id, cls.id.in_(ids))
+                .options(joinedload(cls.category))
             )
-        elif cursor_created_at:
-            stmt = stmt.where(Note.created_at < cursor_created_at)
-        if title:
-            stmt = stmt.where(Note.title.ilike(f"%{title}%"))
-        if start_date:
-            stmt = stmt.where(Note.created_at >= start_date)
-        if end_date:
-            stmt = stmt.where(Note.created_at <= end_date)
-        if archived is not None:
-            stmt = stmt.where(Note.archived.is_(archived))
-        if category_id is not None:
-            stmt = stmt.where(Note.category_id == category_id)
-        return db.session.scalars(
-            stmt.order_by(Note.created_at.desc(), Note.id.desc()).limit(limit)
-        ).all()
+            notes = {note.id: note for note in db.session.scalars(stmt)}
+
+        results = []
+        for index, operation in enumerate(operations):
+            data = operation.get("data", {})
+            note = notes.get(operation.get("id"))
+            if data.get("category_id") not in (None, *category_ids):
+                results.append(
+                    {
+                        "index": index,
+                        "status": HTTPStatus.NOT_FOUND,
+                        "message": gettext("Category not found"),
+                    }
+                )
+                continue
+            if operation["op"] == "create":
+                note = cls(**data, user_id=user_id)
+                db.session.add(note)
+                status = HTTPStatus.CREATED
+            elif note is None or (
+                note.deleted_at is not None and operation["op"] != "restore"
+            ):
+                results.append(
+                    {
+                        "index": index,
+                        "status": HTTPStatus.NOT_FOUND,
+                        "message": gettext("Note not found"),
+                    }
+                )
+                continue
+            elif operation["op"] == "update":
+                note.update(data)
+                status = HTTPStatus.OK
+            elif operation["op"] == "delete":
+                note.soft_delete()
+                status = HTTPStatus.NO_CONTENT
+            else:
+                note.restore()
+                status = HTTPStatus.OK
+            results.append({"index": index, "status": status, "data": note})
+        db.session.flush()
+        return results
 
     def restore(self, commit: bool = False):
         self.deleted_at = None
         if commit:
             db.session.commit()
         return self
+
+
+# Partial indexes matching the keyset query of Note.filter. Declared here
+# as the inherited created_at cannot be ordered in the class body; text()
+# columns would not compare equal to the reflected ones in autogenerate.
+db.Index(
+    "idx_notes_user_list",
+    Note.user_id,
+    Note.archived,
+    Note.created_at.desc(),
+    Note.id.desc(),
+    postgresql_where=text("deleted_at IS NULL"),
+    sqlite_where=text("deleted_at IS NULL"),
+)
+db.Index(
+    "idx_notes_user_category_list",
+    Note.user_id,
+    Note.category_id,
+    Note.archived,
+    Note.created_at.desc(),
+    Note.id.desc(),
+    postgresql_where=text("deleted_at IS NULL"),
+    sqlite_where=text("deleted_at IS NULL"),
+)
+
+NOTE_COLUMNS = tuple(Note.__table__.columns.keys())
+
+
+class NoteRecord(Record):
+    """A note read by a read-only Note.filter"""
+
+    __slots__ = (
+        *NOTE_COLUMNS,
+        "category",
+        "category_name",
+        "excerpt",
+        "search_rank",
+    )
+
+    @staticmethod
+    def attach_categories(notes):
+        """Set ``category`` from the category_name the notes were read
+        with, sharing one CategoryRecord per category."""
+        from src.models.categories import CategoryRecord
+
+        if not notes or not hasattr(notes[0], "category_name"):
+            return notes
+        categories = {}
+        for note in notes:
+            category = None
+            if note.category_id is not None:
+                category = categories.get(note.category_id)
+                if category is None:
+                    category = categories[note.category_id] = CategoryRecord(
+                        id=note.category_id, name=note.category_name
+                    )
+            note.category = category
+        return notes
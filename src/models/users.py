@@ -1,12 +1,25 @@
 from src.models.base_models import CreateUpdateModel, SoftDeleteModel
-from src.extensions import db, bcrypt
-from sqlalchemy import String, Boolean
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from src.extensions import (
+    db,
+    identity_cache,
+    password_pool,
+    revocation_store,
+)
+from sqlalchemy import String, Boolean, event, inspect
+from sqlalchemy.orm import (
+    Mapped,
+    mapped_column,
+    relationship,
+    make_transient_to_detached,
+    object_session,
+)
+from sqlalchemy.orm.util import identity_key
 from typing import TYPE_CHECKING
 from flask_smorest import abort
-from datetime import datetime
+from datetime import datetime, timezone
 
 from src.schemas.auth import validate_password
+from src.revocation_store import RevocationState
 
 if TYPE_CHECKING:
     from src.models.notes import Note
@@ -31,6 +44,12 @@ class User(CreateUpdateModel, SoftDeleteModel):
     notes: Mapped[list["Note"]] = relationship(back_populates="user")
     categories: Mapped[list["Category"]] = relationship(back_populates="user")
 
+    @classmethod
+    def active_criteria(cls):
+        """WHERE clauses matching users who are not deleted or inactive,
+        for queries joining users instead of loading the user first."""
+        return [cls.deleted_at.is_(None), cls.active.is_(True)]
+
     @classmethod
     def get_by_id(
         cls, id, include_deleted: bool = False, include_inactive: bool = False
@@ -59,7 +78,71 @@ class User(CreateUpdateModel, SoftDeleteModel):
             abort(404)
         return result
 
+    @classmethod
+    def get_identity(cls, id):
+        """Load a user for the JWT callbacks, including deleted/inactive.
+
+        Backed by the identity cache, so the blocklist check and the user
+        lookup of one request share a single SELECT and cached users cost
+        no SELECT at all.
+        """
+        row = identity_cache.get(id)
+        if row is None:
+            user = db.session.execute(
+                cls.select_with_deleted().where(cls.id == id)
+            ).scalar_one_or_none()
+            if user is not None:
+                identity_cache.set(
+                    id,
+                    {
+                        attr.key: getattr(user, attr.key)
+                        for attr in cls.__mapper__.column_attrs
+                    },
+                )
+            return user
+        user = db.session.identity_map.get(identity_key(cls, id))
+        if user is None:
+            user = cls(**row)
+            make_transient_to_detached(user)
+            user = db.session.merge(user, load=False)
+        return user
+
+    def revocation_state(self):
+        logout_epoch = None
+        if self.last_logout_at is not None:
+            logout_epoch = self.last_logout_at.replace(
+                tzinfo=timezone.utc
+            ).timestamp()
+        return RevocationState(
+            revoked=self.deleted_at is not None or not self.active,
+            logout_epoch=logout_epoch,
+        )
+
     def set_password(self, password: str, commit: bool = True):
         validate_password(password)
-        hashed = bcrypt.generate_password_hash(password).decode("utf-8")
+        hashed = password_pool.hash(password)
         self.update({"password": hashed}, commit=commit)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_identity_cache(mapper, connection, target):
+    identity_cache.invalidate(target.id)
+
+
+@event.listens_for(User, "after_update")
+def sync_revocation_store(mapper, connection, target):
+    state = None
+    loaded = inspect(target).dict
+    if all(
+        key in loaded for key in ("active", "deleted_at", "last_logout_at")
+    ) and isinstance(loaded["last_logout_at"], (datetime, type(None))):
+        state = target.revocation_state()
+    # Values set from SQL expressions are unknown here, so the slot is
+    # discarded and the next request reads them from the database.
+    revocation_store.queue(object_session(target), target.id, state)
+
+
+@event.listens_for(User, "after_delete")
+def discard_revocation_state(mapper, connection, target):
+    revocation_store.queue(object_session(target), target.id, None)
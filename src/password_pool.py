@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+
+from flask_babel import gettext
+from flask_smorest import abort
+
+from src.hashers import hashers_from_config
+
+
+class PasswordPool:
+    """Bounded worker pool for password hashing and verification.
+
+    At most ``workers + max_queue`` password operations are admitted at a
+    time; anything beyond that is rejected with a 503 right away instead
+    of tying up a request worker behind a login burst.
+
+    The request still waits for its hash, so this only helps servers
+    running several requests per process, e.g. gunicorn's gthread
+    workers: a sync worker serves one request at a time, is held for the
+    whole hash and never fills the pool. The process pool is for hashers
+    that hold the GIL; bcrypt and argon2 release it.
+    """
+
+    def __init__(self, app=None):
+        self.hashers = []
+        self.kind = "thread"
+        self.workers = 1
+        self.max_queue = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._slots = None
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.kind = app.config.setdefault("PASSWORD_POOL_KIND", "thread")
+        self.workers = app.config.setdefault(
+            "PASSWORD_POOL_WORKERS", os.cpu_count() or 1
+        )
+        self.max_queue = app.config.setdefault("PASSWORD_POOL_MAX_QUEUE", 8)
+        self.hashers = hashers_from_config(app.config)
+        if self.kind not in ("thread", "process"):
+            raise ValueError(
+                f"Unknown PASSWORD_POOL_KIND {self.kind!r}, "
+                "expected 'thread' or 'process'"
+            )
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self.shutdown()
+        app.extensions["password_pool"] = self
+
+    def _get_executor(self):
+        # Created lazily so that gunicorn workers forked from a preloaded
+        # app each get their own threads/processes.
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                executor_class = (
+                    ProcessPoolExecutor
+                    if self.kind == "process"
+                    else ThreadPoolExecutor
+                )
+                self._executor = executor_class(max_workers=self.workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if (
+                self._executor is not None
+                and self._executor_pid == os.getpid()
+            ):
+                self._executor.shutdown(wait=False)
+            self._executor = None
+            self._executor_pid = None
+
+    def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            abort(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                message=gettext("Server is busy, please try again later."),
+                headers={"Retry-After": "1"},
+            )
+        with self._lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.latency_total += elapsed
+                self.latency_max = max(self.latency_max, elapsed)
+            self._slots.release()
+
+    @property
+    def hasher(self):
+        """The hasher new passwords are hashed with"""
+        return self.hashers[0]
+
+    def hash(self, password: str) -> str:
+        return self.run(self.hasher.hash, password)
+
+    def check(self, password_hash: str, password: str) -> bool:
+        for hasher in self.hashers:
+            if hasher.identify(password_hash):
+                return self.run(hasher.verify, password_hash, password)
+        return False
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        return not self.hasher.identify(
+            password_hash
+        ) or self.hasher.needs_rehash(password_hash)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hasher": repr(self.hasher),
+                "kind": self.kind,
+                "workers": self.workers,
+                "in_flight": self.in_flight,
+                "queue_depth": max(self.in_flight - self.workers, 0),
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "latency_total": self.latency_total,
+                "latency_avg": (
+                    self.latency_total / self.completed
+                    if self.completed
+                    else 0.0
+                ),
+                "latency_max": self.latency_max,
+            }
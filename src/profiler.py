@@ -0,0 +1,195 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import (
+    current_app,
+    g,
+    has_app_context,
+    has_request_context,
+    request,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestProfile:
+    """Timings collected while one request is handled"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.sections = {}
+        self._active = set()
+
+
+class Profiler:
+    """Opt-in per-request instrumentation.
+
+    Counts the SQL statements each request runs and the time spent in
+    them, in serialization (CompiledSchema dumps and JSON encoding) and
+    overall, reported in a Server-Timing header. Statements slower than
+    PROFILER_SLOW_QUERY_MS are logged with their parameters and the
+    endpoint that ran them, and so are requests running more than
+    PROFILER_QUERY_BUDGET statements. Streamed bodies are produced after
+    the header is sent and are not included.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.slow_query_ms = 100
+        self.query_budget = None
+        self.requests = 0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slow_queries = 0
+        self.over_budget = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.setdefault("PROFILER_ENABLED", False)
+        self.slow_query_ms = app.config.setdefault(
+            "PROFILER_SLOW_QUERY_MS", 100
+        )
+        self.query_budget = app.config.setdefault(
+            "PROFILER_QUERY_BUDGET", None
+        )
+        if not app.extensions.get("profiler"):
+            # Checked per request, so that the profiler can be switched on
+            # after the app has started serving
+            app.before_request(self.start_request)
+            app.after_request(self.finish_request)
+            app.teardown_request(self.discard_request)
+        if self.enabled:
+            # Engine events are only paid for while profiling
+            if not event.contains(
+                Engine, "before_cursor_execute", self.before_cursor_execute
+            ):
+                event.listen(
+                    Engine, "before_cursor_execute", self.before_cursor_execute
+                )
+                event.listen(
+                    Engine, "after_cursor_execute", self.after_cursor_execute
+                )
+            if not hasattr(app.json.response, "__wrapped__"):
+                app.json.response = self.timed("serialize", app.json.response)
+        app.extensions["profiler"] = self
+
+    def current(self):
+        """The profile of the request being handled, if profiling"""
+        if not self.enabled or not has_app_context():
+            return None
+        return g.get("profile")
+
+    def start_request(self):
+        if self.enabled:
+            g.profile = RequestProfile()
+
+    def discard_request(self, exc=None):
+        g.pop("profile", None)
+
+    def finish_request(self, response):
+        profile = self.current()
+        if profile is None:
+            return response
+        self.discard_request()
+        total = time.perf_counter() - profile.started
+        metrics = [
+            f'db;dur={profile.sql * 1000:.2f};desc="{profile.queries} queries"'
+        ]
+        metrics += [
+            f"{name};dur={seconds * 1000:.2f}"
+            for name, seconds in profile.sections.items()
+        ]
+        metrics.append(f"total;dur={total * 1000:.2f}")
+        response.headers.add("Server-Timing", ", ".join(metrics))
+        over_budget = (
+            self.query_budget is not None
+            and profile.queries > self.query_budget
+        )
+        if over_budget:
+            current_app.logger.warning(
+                "%s ran %d queries, over the budget of %d",
+                request.endpoint,
+                profile.queries,
+                self.query_budget,
+            )
+        with self._lock:
+            self.requests += 1
+            self.queries += profile.queries
+            self.sql_seconds += profile.sql
+            self.over_budget += over_budget
+        return response
+
+    def before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        if context is not None:
+            context.profiler_started = time.perf_counter()
+
+    def after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        started = getattr(context, "profiler_started", None)
+        if started is None or not self.enabled:
+            return
+        elapsed = time.perf_counter() - started
+        profile = self.current()
+        if profile is not None:
+            profile.queries += 1
+            profile.sql += elapsed
+        if elapsed * 1000 >= self.slow_query_ms:
+            with self._lock:
+                self.slow_queries += 1
+            if has_app_context():
+                current_app.logger.warning(
+                    "Slow query (%.1f ms) in %s: %s %r",
+                    elapsed * 1000,
+                    request.endpoint if has_request_context() else None,
+                    statement,
+                    parameters,
+                )
+
+    @contextmanager
+    def section(self, name: str):
+        """Add the time spent inside to the request's name timing.
+
+        Nested sections of the same name count once.
+        """
+        profile = self.current()
+        if profile is None or name in profile._active:
+            yield
+            return
+        profile._active.add(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            profile._active.discard(name)
+            profile.sections[name] = (
+                profile.sections.get(name, 0.0) + time.perf_counter() - started
+            )
+
+    def timed(self, name: str, func):
+        """Wrap func in section(name)"""
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.section(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "queries": self.queries,
+                "sql_seconds": self.sql_seconds,
+                "slow_queries": self.slow_queries,
+                "over_budget": self.over_budget,
+            }
@@ -0,0 +1,350 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, after_this_request, request
+from flask_babel import get_locale
+from flask_jwt_extended import current_user, verify_jwt_in_request
+
+from src.compression import matching_etag
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+CACHED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+class MemoryBackend:
+    """LRU of cached responses local to one worker.
+
+    Version counters are kept in the worker too unless ``versions`` is
+    given, so without it a write only invalidates the entries of the
+    worker that handled it. Pass a ``SQLiteVersions`` when there is more
+    than one worker.
+    """
+
+    def __init__(self, max_entries: int, versions=None):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._shared_versions = versions
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, headers, body = entry
+            if expires_at <= time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return headers, body
+
+    def set(self, key, headers, body: bytes, ttl: int):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, headers, body)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        self._bytes -= len(self._entries.pop(key)[2])
+
+    def version(self, user_id: int) -> int:
+        if self._shared_versions is not None:
+            return self._shared_versions.version(user_id)
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: int):
+        if self._shared_versions is not None:
+            return self._shared_versions.bump(user_id)
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def clear(self):
+        if self._shared_versions is not None:
+            self._shared_versions.clear()
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+            }
+
+
+class SQLiteVersions:
+    """Per-user version counters in a SQLite file shared by every worker
+    on a node, so a write handled by one worker invalidates what the
+    others have cached for that user."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS versions "
+                "(user_id INTEGER PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+
+    def _connect(self):
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def version(self, user_id: int) -> int:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT version FROM versions WHERE user_id = ?", (user_id,)
+            )
+            .fetchone()
+        )
+        return row[0] if row else 0
+
+    def bump(self, user_id: int):
+        self._connect().execute(
+            "INSERT INTO versions VALUES (?, 1) ON CONFLICT (user_id) "
+            "DO UPDATE SET version = version + 1",
+            (user_id,),
+        )
+
+    def clear(self):
+        self._connect().execute("DELETE FROM versions")
+
+
+class SQLiteBackend(SQLiteVersions):
+    """Cached responses in a SQLite file shared by every worker on a node,
+    next to their version counters."""
+
+    def __init__(self, path: str, max_entries: int):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.evictions = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, "
+                "headers TEXT NOT NULL, body BLOB NOT NULL, "
+                "expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_used_at "
+                "ON entries (used_at)"
+            )
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT headers, body FROM entries "
+            "WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE entries SET used_at = ? WHERE key = ?", (time.time(), key)
+        )
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, headers, body: bytes, ttl: int):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+            (key, json.dumps(headers), body, now + ttl, now),
+        )
+        excess = (
+            conn.execute("SELECT count(*) FROM entries").fetchone()[0]
+            - self.max_entries
+        )
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+                "ORDER BY used_at LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def clear(self):
+        super().clear()
+        self._connect().execute("DELETE FROM entries")
+
+    def stats(self):
+        entries, size = (
+            self._connect()
+            .execute(
+                "SELECT count(*), coalesce(sum(length(body)), 0) FROM entries"
+            )
+            .fetchone()
+        )
+        return {"entries": entries, "bytes": size, "evictions": self.evictions}
+
+
+class ResponseCache:
+    """Per-user cache of rendered GET responses.
+
+    Keys combine the user, the user's version counter, the endpoint, the
+    sorted query arguments and the locale. Any write to a user's data
+    bumps the counter, so older entries are never read again and age out.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.setdefault("RESPONSE_CACHE_BACKEND", None)
+        path = app.config.setdefault("RESPONSE_CACHE_PATH", None)
+        max_entries = app.config.setdefault("RESPONSE_CACHE_MAX_ENTRIES", 1024)
+        self.ttl = app.config.setdefault("RESPONSE_CACHE_TTL", 60)
+        if kind is None:
+            self.backend = None
+        elif kind == "memory":
+            # Entries stay in the worker, versions are shared when they can
+            # be so that a write reaches every worker's entries
+            if path:
+                self.backend = MemoryBackend(max_entries, SQLiteVersions(path))
+            else:
+                self.backend = MemoryBackend(max_entries)
+                if "gunicorn" in sys.modules:
+                    app.logger.warning(
+                        "RESPONSE_CACHE_BACKEND=memory without "
+                        "RESPONSE_CACHE_PATH: writes only invalidate the "
+                        "cache of the worker that handles them"
+                    )
+        elif kind == "sqlite":
+            self.backend = SQLiteBackend(path, max_entries)
+        else:
+            raise ValueError(
+                f"Unknown RESPONSE_CACHE_BACKEND {kind!r}, "
+                "expected 'memory' or 'sqlite'"
+            )
+        self.hits = self.misses = 0
+        app.extensions["response_cache"] = self
+
+    @property
+    def enabled(self):
+        return self.backend is not None and self.ttl > 0
+
+    def key(self, user_id: int):
+        args = "&".join(
+            f"{name}={value}"
+            for name, value in sorted(request.args.items(True))
+        )
+        return ":".join(
+            (
+                str(user_id),
+                str(self.backend.version(user_id)),
+                request.endpoint,
+                args,
+                str(get_locale()),
+            )
+        )
+
+    def invalidate(self, user_id: int):
+        if self.enabled:
+            self.backend.bump(user_id)
+
+    def invalidated_by(self, blueprint):
+        """Bump the user's version after every write to blueprint"""
+
+        @blueprint.after_request
+        def invalidate_after_write(response):
+            user_id = (request.view_args or {}).get("user_id")
+            if request.method not in SAFE_METHODS and user_id is not None:
+                self.invalidate(user_id)
+            return response
+
+        return blueprint
+
+    def cached(self, func):
+        """Serve a view's 200 responses from the cache.
+
+        Applied above the flask-smorest decorators. The caller must be the
+        user of the URL before anything is served; otherwise the view runs
+        and rejects the request as usual.
+        """
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            user_id = kwargs.get("user_id")
+            if not self.enabled or request.method != "GET":
+                return func(*args, **kwargs)
+            verify_jwt_in_request(optional=True)
+            if not current_user or current_user.id != user_id:
+                return func(*args, **kwargs)
+            key = self.key(user_id)
+            entry = self.backend.get(key)
+            if entry is not None:
+                with self._lock:
+                    self.hits += 1
+                headers, body = entry
+                response = Response(body, headers=headers)
+                etag, _ = response.get_etag()
+                matched = etag and matching_etag(request.if_none_match, etag)
+                if matched:
+                    # The client may hold a compressed representation
+                    response.set_etag(matched)
+                return response.make_conditional(request)
+            with self._lock:
+                self.misses += 1
+            response = func(*args, **kwargs)
+
+            # Stored once the response is final, with its ETag
+            @after_this_request
+            def store(response):
+                if response.status_code == 200 and not response.is_streamed:
+                    self.backend.set(
+                        key,
+                        [
+                            (name, value)
+                            for name, value in response.headers
+                            if name in CACHED_HEADERS
+                        ],
+                        response.get_data(),
+                        self.ttl,
+                    )
+                return response
+
+            return response
+
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        return stats
@@ -0,0 +1,199 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+_MAGIC = b"NOTESRV1"
+_HEADER = struct.Struct("<8sQ")
+# user_id, logout epoch (0.0 = never), written at (epoch), status
+_SLOT = struct.Struct("<qddB7x")
+_USER_ID = struct.Struct("<q")
+_MAX_PROBES = 64
+
+STATUS_UNKNOWN = 0
+STATUS_ACTIVE = 1
+STATUS_REVOKED = 2
+
+
+class RevocationState(NamedTuple):
+    revoked: bool
+    logout_epoch: Optional[float]
+
+
+class RevocationStore:
+    """Revocation state per user, shared by every worker on a node.
+
+    Backed by a memory-mapped file holding an open-addressing table of
+    fixed size slots, so gunicorn workers see each other's logouts and
+    deactivations without asking the database. Writes happen after the
+    user row is committed; a missing, unknown or expired slot is "cold"
+    and callers fall back to the database.
+    """
+
+    def __init__(self, app=None):
+        self.path = None
+        self.slots = 0
+        self.ttl = 0
+        self._fd = None
+        self._map = None
+        self._lock = threading.Lock()
+        self._pending_key = ("revocation_store", id(self))
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_rollback", self._after_rollback)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.close()
+        path = app.config.setdefault("REVOCATION_STORE_PATH", None)
+        slots = app.config.setdefault("REVOCATION_STORE_SLOTS", 65536)
+        ttl = app.config.setdefault("REVOCATION_STORE_TTL", 300)
+        if path:
+            self.open(path, slots=slots, ttl=ttl)
+        app.extensions["revocation_store"] = self
+
+    @property
+    def enabled(self):
+        return self._map is not None
+
+    def open(self, path, slots: int = 65536, ttl: int = 300):
+        if fcntl is None:
+            raise RuntimeError("The revocation store requires fcntl.")
+        self.close()
+        size = _HEADER.size + slots * _SLOT.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size != size or _HEADER.unpack(
+                os.pread(fd, _HEADER.size, 0)
+            ) != (_MAGIC, slots):
+                # Missing or built with another layout: start cold
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, _HEADER.pack(_MAGIC, slots), 0)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._map = mmap.mmap(fd, size)
+        self.path = path
+        self.slots = slots
+        self.ttl = ttl
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+        self._map = None
+        self._fd = None
+        self.path = None
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        # lockf locks are per process, so threads also need self._lock
+        with self._lock:
+            fcntl.lockf(
+                self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            )
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _find(self, user_id: int):
+        """Return (offset, found) of the user's slot, offset None if full"""
+        start = (user_id * 2654435761) % self.slots
+        for probe in range(min(_MAX_PROBES, self.slots)):
+            offset = _HEADER.size + ((start + probe) % self.slots) * _SLOT.size
+            slot_user_id = _USER_ID.unpack_from(self._map, offset)[0]
+            if slot_user_id == user_id:
+                return offset, True
+            if slot_user_id == 0:
+                return offset, False
+        return None, False
+
+    def _is_fresh(self, status, written_at):
+        return status != STATUS_UNKNOWN and time.time() - written_at <= (
+            self.ttl
+        )
+
+    def get(self, user_id: int) -> Optional[RevocationState]:
+        """Return the shared state of a user, or None when cold"""
+        if not self.enabled:
+            return None
+        with self._locked(exclusive=False):
+            offset, found = self._find(user_id)
+            if not found:
+                return None
+            _, logout_epoch, written_at, status = _SLOT.unpack_from(
+                self._map, offset
+            )
+        if not self._is_fresh(status, written_at):
+            return None
+        return RevocationState(status == STATUS_REVOKED, logout_epoch or None)
+
+    def put(self, user_id: int, state: RevocationState, overwrite=True):
+        """Write a user's state.
+
+        ``overwrite=False`` is used when warming from a database read so
+        that it never clobbers a fresher write made by a committed change.
+        """
+        if not self.enabled:
+            return
+        with self._locked(exclusive=True):
+            offset, found = self._find(user_id)
+            if offset is None:
+                return
+            if found and not overwrite:
+                _, _, written_at, status = _SLOT.unpack_from(self._map, offset)
+                if self._is_fresh(status, written_at):
+                    return
+            _SLOT.pack_into(
+                self._map,
+                offset,
+                user_id,
+                state.logout_epoch or 0.0,
+                time.time(),
+                STATUS_REVOKED if state.revoked else STATUS_ACTIVE,
+            )
+
+    def discard(self, user_id: int):
+        """Mark a user's slot cold so the next read goes to the database"""
+        if not self.enabled:
+            return
+        with self._locked(exclusive=True):
+            offset, found = self._find(user_id)
+            if found:
+                _SLOT.pack_into(
+                    self._map, offset, user_id, 0.0, 0.0, STATUS_UNKNOWN
+                )
+
+    def queue(self, session, user_id: int, state: Optional[RevocationState]):
+        """Write a user's state once the session commits.
+
+        A ``None`` state discards the slot instead.
+        """
+        if not self.enabled or session is None:
+            return
+        session.info.setdefault(self._pending_key, {})[user_id] = state
+
+    def _after_commit(self, session):
+        pending = session.info.pop(self._pending_key, None)
+        for user_id, state in (pending or {}).items():
+            if state is None:
+                self.discard(user_id)
+            else:
+                self.put(user_id, state)
+
+    def _after_rollback(self, session):
+        session.info.pop(self._pending_key, None)
@@ -1,4 +1,18 @@
-from marshmallow import Schema, fields, validate
+from functools import lru_cache
+
+from flask import current_app, g, has_app_context
+from flask_babel import gettext
+from itsdangerous import BadSignature, URLSafeSerializer
+from marshmallow import Schema, fields, validate, pre_load, ValidationError
+
+from src.schemas.compiled import CompiledSchema
+
+
+def cursor_serializer():
+    secret = current_app.config.get("CURSOR_SECRET_KEY") or (
+        current_app.config["JWT_SECRET_KEY"]
+    )
+    return URLSafeSerializer(secret, salt="pagination-cursor")
 
 
 class PaginationRequestSchema(Schema):
@@ -7,7 +21,63 @@ class PaginationRequestSchema(Schema):
     )
     cursor_created_at = fields.DateTime()
     cursor_id = fields.Int()
+    direction = fields.Str(
+        validate=validate.OneOf(["next", "prev"]), load_default="next"
+    )
+    cursor = fields.Str(
+        load_only=True,
+        metadata={"description": "Opaque token from a next/prev link"},
+    )
+
+    @pre_load
+    def decode_cursor(self, data, **kwargs):
+        """Replace a cursor token with the arguments it was made from.
+
+        The token carries the filters of the page it came from, so they
+        win over any other query argument.
+        """
+        if "cursor" not in data:
+            return data
+        try:
+            return cursor_serializer().loads(data["cursor"])
+        except BadSignature:
+            raise ValidationError(gettext("Invalid cursor"), "cursor")
+
+    def encode_cursor(self, args: dict) -> str:
+        return cursor_serializer().dumps(self.dump(args))
 
 
 class PaginationResponseSchema(Schema):
     next = fields.Str()
+    prev = fields.Str()
+
+
+@lru_cache(maxsize=256)
+def _projection(schema_class, only, exclude):
+    return schema_class(only=only, exclude=exclude)
+
+
+class ProjectedSchema(CompiledSchema):
+    """Response schema a view narrows to some of its fields per request.
+
+    Declared on the route, so the API docs list every field the response
+    can have, while the view picks the ones dumped with ``project``.
+    """
+
+    @classmethod
+    def project(cls, only=None, exclude=()):
+        """Dump only these fields, or all but exclude, for this request"""
+        g.projections = {
+            **g.get("projections", {}),
+            cls: (tuple(only) if only else None, tuple(exclude)),
+        }
+
+    def dump(self, obj, *, many=None):
+        projections = g.get("projections", {}) if has_app_context() else {}
+        only, exclude = projections.get(type(self), (None, ()))
+        if only is None and not exclude:
+            return super().dump(obj, many=many)
+        many = self.many if many is None else bool(many)
+        # Narrowed schemas are built and compiled once per field set
+        schema = _projection(type(self), only, exclude)
+        return CompiledSchema.dump(schema, obj, many=many)
@@ -1,8 +1,14 @@
 from marshmallow import Schema, fields, validate
 from src.schemas.notes import NoteSchema
+from src.schemas.base_schemas import (
+    PaginationRequestSchema,
+    PaginationResponseSchema,
+    ProjectedSchema,
+)
+from src.schemas.compiled import CompiledSchema
 
 
-class CategorySchema(Schema):
+class CategorySchema(CompiledSchema):
     id = fields.Int(dump_only=True)
     name = fields.Str(required=True, validate=validate.Length(min=1, max=100))
     description = fields.Str(allow_none=True)
@@ -22,10 +28,35 @@ class UpdateCategorySchema(Schema):
     color = fields.Str(allow_none=True)
 
 
-class CategorySummarySchema(CategorySchema):
-    class Meta:
-        exclude = ("notes",)
+class CategoryListSchema(CategorySchema, ProjectedSchema):
+    """A category of the list, without its notes in a summary"""
 
 
 class CategoryListRequestSchema(Schema):
     summary = fields.Bool(load_default=False)
+    name = fields.Str()
+
+
+class CategoryListItemSchema(CategorySchema, ProjectedSchema):
+    """A category of the overview, with its note count and most recent
+    notes"""
+
+    note_count = fields.Int(dump_only=True)
+    notes = fields.List(
+        fields.Nested(NoteSchema(only=["id", "title", "created_at"])),
+        attribute="note_previews",
+        dump_only=True,
+    )
+
+
+class CategoryOverviewRequestSchema(
+    PaginationRequestSchema, CategoryListRequestSchema
+):
+    # Most recent notes shown per category, the count covers all of them
+    notes_limit = fields.Int(
+        validate=validate.Range(min=0, max=50), load_default=5
+    )
+
+
+class CategoryOverviewResponseSchema(PaginationResponseSchema):
+    data = fields.Nested(CategoryListItemSchema, many=True)
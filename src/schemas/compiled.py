@@ -0,0 +1,125 @@
+from collections.abc import Mapping
+from functools import partial
+
+from marshmallow import Schema, fields, missing
+from marshmallow.utils import ensure_text_type
+
+from src.extensions import profiler
+
+
+def _converter(field, name: str, env: dict, value: str = "v"):
+    """Return an expression converting a non-None value the way field
+    would, or None when the field has to run its own serialize."""
+    field_class = type(field)
+    if isinstance(field, fields.Number):
+        if (
+            field_class._serialize is fields.Number._serialize
+            and field_class._format_num is fields.Number._format_num
+            and not field.as_string
+        ):
+            env[name] = field.num_type
+            return f"{name}({value})"
+    elif isinstance(field, fields.String):
+        if field_class._serialize is fields.String._serialize:
+            env["ensure_text_type"] = ensure_text_type
+            return (
+                f"{value} if type({value}) is str "
+                f"else ensure_text_type({value})"
+            )
+    elif isinstance(field, fields.Boolean):
+        if field_class._serialize is fields.Boolean._serialize:
+            env[name] = field._serialize
+            return (
+                f"{value} if {value} is True or {value} is False "
+                f"else {name}({value}, None, None)"
+            )
+    elif isinstance(field, fields.DateTime):
+        if field_class._serialize is fields.DateTime._serialize:
+            data_format = field.format or field.DEFAULT_FORMAT
+            if data_format in field.SERIALIZATION_FUNCS:
+                env[name] = field.SERIALIZATION_FUNCS[data_format]
+                return f"{name}({value})"
+    elif isinstance(field, fields.Nested):
+        if field_class._serialize is fields.Nested._serialize:
+            schema = field.schema
+            env[name] = partial(schema.dump, many=schema.many or field.many)
+            return f"{name}({value})"
+    elif isinstance(field, fields.List):
+        inner = _converter(field.inner, f"{name}_inner", env, "item")
+        if field_class._serialize is fields.List._serialize and inner:
+            return f"[None if item is None else {inner} for item in {value}]"
+    return None
+
+
+def compile_dump(schema: Schema):
+    """Generate a function dumping one object like ``schema.dump``.
+
+    Each field becomes an inline attribute read and conversion. Fields
+    with custom serialization, defaults or dotted attributes call the
+    field as marshmallow would, and mappings or other subscriptable
+    objects go through the regular dump.
+    """
+    env = {
+        "MISSING": missing,
+        "Mapping": Mapping,
+        "get_attribute": schema.get_attribute,
+        "fallback": partial(Schema.dump, schema, many=False),
+    }
+    lines = [
+        "def dump(obj):",
+        "    if isinstance(obj, Mapping) or hasattr(obj, '__getitem__'):",
+        "        return fallback(obj)",
+        "    out = {}",
+    ]
+    for index, (field_name, field) in enumerate(schema.dump_fields.items()):
+        attribute = field.attribute or field_name
+        key = field.data_key or field_name
+        converter = _converter(field, f"convert_{index}", env)
+        if (
+            converter is None
+            or "." in attribute
+            or field.dump_default is not missing
+        ):
+            env[f"field_{index}"] = field
+            lines += [
+                f"    v = field_{index}.serialize({field_name!r}, obj, "
+                "accessor=get_attribute)",
+                "    if v is not MISSING:",
+                f"        out[{key!r}] = v",
+            ]
+        else:
+            lines += [
+                f"    v = getattr(obj, {attribute!r}, MISSING)",
+                "    if v is not MISSING:",
+                f"        out[{key!r}] = None if v is None else {converter}",
+            ]
+    lines.append("    return out")
+    exec("\n".join(lines), env)
+    return env["dump"]
+
+
+class CompiledSchema(Schema):
+    """Schema dumping through a function generated from its fields.
+
+    Gives the same output as marshmallow's dump at a fraction of the
+    cost, which matters for pages of hundreds of notes. Schemas with
+    dump hooks keep the regular implementation.
+    """
+
+    _dump_one = None
+
+    def dump(self, obj, *, many=None):
+        if profiler.enabled:
+            with profiler.section("serialize"):
+                return self._dump(obj, many)
+        return self._dump(obj, many)
+
+    def _dump(self, obj, many):
+        if self._hooks.get("pre_dump") or self._hooks.get("post_dump"):
+            return super().dump(obj, many=many)
+        if self._dump_one is None:
+            self._dump_one = compile_dump(self)
+        many = self.many if many is None else bool(many)
+        if many:
+            return [self._dump_one(item) for item in obj]
+        return self._dump_one(obj)
@@ -1,12 +1,27 @@
-from marshmallow import Schema, fields
+from flask import current_app
+from flask_babel import gettext
+from marshmallow import (
+    EXCLUDE,
+    Schema,
+    ValidationError,
+    fields,
+    validate,
+    validates,
+    validates_schema,
+    pre_load,
+)
+
+from webargs.fields import DelimitedList
 
 from src.schemas.base_schemas import (
     PaginationRequestSchema,
     PaginationResponseSchema,
+    ProjectedSchema,
 )
+from src.schemas.compiled import CompiledSchema
 
 
-class NoteSchema(Schema):
+class NoteSchema(CompiledSchema):
     id = fields.Int(dump_only=True)
     title = fields.Str(required=True)
     user_id = fields.Int(dump_only=True)
@@ -21,6 +36,31 @@ class NoteSchema(Schema):
     updated_at = fields.DateTime(dump_only=True)
 
 
+class SparseNoteSchema(NoteSchema):
+    """NoteSchema plus the fields only a sparse fieldset can ask for"""
+
+    excerpt = fields.Str(dump_only=True)
+
+
+class ProjectedNoteSchema(SparseNoteSchema, ProjectedSchema):
+    """A note in the fields asked for, NoteSchema's when none are"""
+
+
+NOTE_FIELDS = tuple(SparseNoteSchema._declared_fields)
+
+
+class NoteFieldsRequestSchema(Schema):
+    only = DelimitedList(
+        fields.Str(validate=validate.OneOf(NOTE_FIELDS)),
+        data_key="fields",
+        validate=validate.Length(min=1),
+        metadata={"description": "Comma separated fields to return"},
+    )
+    excerpt_length = fields.Int(
+        validate=validate.Range(min=1, max=1000), load_default=200
+    )
+
+
 class UpdateNoteSchema(Schema):
     title = fields.Str()
     archived = fields.Int()
@@ -29,10 +69,145 @@ class UpdateNoteSchema(Schema):
 
 
 class FetchNotesResponseSchema(PaginationResponseSchema):
-    data = fields.Nested(NoteSchema, many=True)
+    data = fields.Nested(ProjectedNoteSchema, many=True)
 
 
-class FetchNotesRequestSchema(PaginationRequestSchema):
+class FetchNotesRequestSchema(
+    PaginationRequestSchema, NoteFieldsRequestSchema
+):
     title = fields.Str()
+    archived = fields.Bool()
+    category_id = fields.Int()
+    # Full-text search over title and content, ordered by relevance
+    search = fields.Str(validate=validate.Length(min=1, max=200))
+    cursor_rank = fields.Float()
     start_date = fields.DateTime()
     end_date = fields.DateTime()
+
+
+class NoteBatchOperationSchema(Schema):
+    op = fields.Str(
+        required=True,
+        validate=validate.OneOf(["create", "update", "delete", "restore"]),
+    )
+    id = fields.Int()
+    data = fields.Nested(UpdateNoteSchema)
+
+    @validates_schema
+    def validate_operation(self, data, **kwargs):
+        if data["op"] == "create":
+            if "title" not in data.get("data", {}):
+                raise ValidationError(
+                    gettext("A title is required to create a note"), "data"
+                )
+        elif "id" not in data:
+            raise ValidationError(gettext("Missing note id"), "id")
+
+
+class NoteBatchRequestSchema(Schema):
+    operations = fields.List(
+        fields.Nested(NoteBatchOperationSchema),
+        required=True,
+        validate=validate.Length(min=1),
+    )
+
+    @validates("operations")
+    def validate_size(self, value, **kwargs):
+        max_operations = current_app.config["NOTE_BATCH_MAX_OPERATIONS"]
+        if len(value) > max_operations:
+            raise ValidationError(
+                gettext("At most %(max)s operations per batch")
+                % {"max": max_operations}
+            )
+
+
+class NoteBatchResultSchema(Schema):
+    index = fields.Int()
+    status = fields.Int()
+    message = fields.Str()
+    data = fields.Nested(NoteSchema)
+
+
+class NoteBatchResponseSchema(Schema):
+    results = fields.Nested(NoteBatchResultSchema, many=True)
+
+
+class NoteMassFilterSchema(Schema):
+    title = fields.Str()
+    # Archived and unarchived notes alike unless set
+    archived = fields.Bool(load_default=None, allow_none=True)
+    category_id = fields.Int()
+    start_date = fields.DateTime()
+    end_date = fields.DateTime()
+
+
+class NoteExportRequestSchema(NoteMassFilterSchema):
+    format = fields.Str(
+        validate=validate.OneOf(["ndjson", "csv"]), load_default="ndjson"
+    )
+    compress = fields.Str(validate=validate.OneOf(["gzip"]))
+
+
+class NoteImportRequestSchema(Schema):
+    format = fields.Str(
+        validate=validate.OneOf(["ndjson", "csv"]), load_default="ndjson"
+    )
+    compress = fields.Str(validate=validate.OneOf(["gzip"]))
+
+
+class NoteImportSchema(NoteSchema):
+    """One imported note, in the shape written by the export endpoint"""
+
+    class Meta:
+        # ids, timestamps and category_id belong to the exporting account
+        unknown = EXCLUDE
+        exclude = ("category_id",)
+
+    # Checked here rather than left to the column, which fails the batch
+    title = fields.Str(required=True, validate=validate.Length(max=100))
+    archived = fields.Bool(load_default=False)
+    category_name = fields.Str(allow_none=True, load_default=None)
+
+    @pre_load
+    def blank_to_none(self, data, **kwargs):
+        # CSV has no null, the export writes an empty value instead
+        if data.get("category_name") == "":
+            return {**data, "category_name": None}
+        return data
+
+
+class NoteMassOperationSchema(Schema):
+    action = fields.Str(
+        required=True,
+        validate=validate.OneOf(["archive", "unarchive", "delete", "move"]),
+    )
+    filters = fields.Nested(NoteMassFilterSchema, load_default=dict)
+    # Destination of a move, null to remove the notes from their category
+    category_id = fields.Int(allow_none=True)
+    # Operating on every note has to be asked for, not left to missing
+    # filters
+    all_notes = fields.Bool(data_key="all", load_default=False)
+    dry_run = fields.Bool(load_default=False)
+
+    @validates_schema
+    def validate_move(self, data, **kwargs):
+        if data["action"] == "move" and "category_id" not in data:
+            raise ValidationError(
+                gettext("Missing destination category"), "category_id"
+            )
+
+    @validates_schema
+    def validate_scope(self, data, **kwargs):
+        filters = [
+            value for value in data["filters"].values() if value is not None
+        ]
+        if not filters and not data["all_notes"]:
+            raise ValidationError(
+                gettext("Set a filter, or all to apply to every note"),
+                "filters",
+            )
+
+
+class NoteMassOperationResponseSchema(Schema):
+    affected = fields.Int()
+    dry_run = fields.Bool()
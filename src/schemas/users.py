@@ -2,6 +2,7 @@ from marshmallow import Schema, fields, validate, pre_load, ValidationError
 from flask_babel import gettext
 
 from src.schemas.auth import get_field_names
+from src.schemas.compiled import CompiledSchema
 
 
 class UpdateUserSchema(Schema):
@@ -30,7 +31,7 @@ class UpdateUserSchema(Schema):
         return data
 
 
-class UserSchema(Schema):
+class UserSchema(CompiledSchema):
     id = fields.Int(dump_only=True)
     first_name = fields.Str()
     last_name = fields.Str()
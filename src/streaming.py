@@ -0,0 +1,122 @@
+import csv
+import gzip
+import io
+import json
+import zlib
+from datetime import datetime
+
+# Lines are buffered into chunks of about this many bytes before being
+# written to the response
+CHUNK_SIZE = 64 * 1024
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def ndjson_lines(rows, fields):
+    """Encode each row as one JSON object per line"""
+    for row in rows:
+        yield json.dumps(
+            {field: _plain(value) for field, value in zip(fields, row)},
+            ensure_ascii=False,
+        ) + "\n"
+
+
+def csv_lines(rows, fields):
+    """Encode rows as CSV, starting with a header line"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # The header alone when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def chunked(lines, size: int = CHUNK_SIZE):
+    """Join encoded lines into chunks of at least size bytes"""
+    chunk = []
+    length = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        chunk.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def gzipped(chunks):
+    """Compress a stream of chunks into a gzip file, chunk by chunk"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def text_lines(stream, compress=None):
+    """Decode a binary file object such as ``request.stream`` line by
+    line, gunzipping it on the fly."""
+    if compress == "gzip":
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    # newline="" keeps line breaks inside quoted CSV values intact
+    return io.TextIOWrapper(
+        stream, encoding="utf-8", errors="replace", newline=""
+    )
+
+
+class UploadError(Exception):
+    """An upload that cannot be read past some line"""
+
+
+# Raised while reading a truncated or corrupt gzip stream, or CSV the csv
+# module gives up on
+READ_ERRORS = (csv.Error, EOFError, OSError, zlib.error)
+
+
+def ndjson_records(lines):
+    """Yield (line number, record, error) for each non-blank line.
+
+    Raises UploadError when the upload cannot be read any further.
+    """
+    number = 0
+    try:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield number, None, "Invalid JSON"
+                continue
+            if not isinstance(record, dict):
+                yield number, None, "Expected a JSON object"
+                continue
+            yield number, record, None
+    except READ_ERRORS as err:
+        raise UploadError(f"Line {number + 1}: {err}") from err
+
+
+def csv_records(lines):
+    """Yield (line number, record, error) for each row after the header.
+
+    Raises UploadError when the upload cannot be read any further.
+    """
+    reader = csv.DictReader(lines)
+    try:
+        for record in reader:
+            yield reader.line_num, record, None
+    except READ_ERRORS as err:
+        raise UploadError(f"Line {reader.line_num + 1}: {err}") from err
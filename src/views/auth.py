@@ -14,7 +14,8 @@ from flask_babel import gettext
 
 from src.schemas.auth import RegisterSchema, UpdatePasswordSchema
 from src.schemas.users import UserSchema
-from src.extensions import db, bcrypt
+from src.extensions import db, password_pool
+from src.models.base_models import utcnow
 from src.models.users import User
 
 auth_blueprint = Blueprint("auth", __name__, url_prefix="/api/auth")
@@ -30,9 +31,7 @@ def register(req_json):
     if existing_user:
         abort(HTTPStatus.CONFLICT, message=gettext("Email already registered"))
 
-    hashed = bcrypt.generate_password_hash(req_json["password"]).decode(
-        "utf-8"
-    )
+    hashed = password_pool.hash(req_json["password"])
     if not req_json.get("preferred_language"):
         req_json["preferred_language"] = (
             request.accept_languages.best_match(["en_CA", "zh_CN"]) or "en_CA"
@@ -49,7 +48,7 @@ def register(req_json):
 @jwt_required()
 def update_password(req_json):
     user = current_user
-    if not bcrypt.check_password_hash(user.password, req_json["password"]):
+    if not password_pool.check(user.password, req_json["password"]):
         abort(
             HTTPStatus.UNAUTHORIZED,
             message=gettext("Invalid current password"),
@@ -65,13 +64,20 @@ def login():
         User.email == req_json["email"].lower(), User.active.is_(True)
     )
     user = db.session.execute(stmt).scalar_one_or_none()
-    if not user or not bcrypt.check_password_hash(
+    if not user or not password_pool.check(
         user.password, req_json["password"]
     ):
         abort(
             HTTPStatus.UNAUTHORIZED,
             message=gettext("Invalid email or password"),
         )
+    if password_pool.needs_rehash(user.password):
+        # Stored with older hasher settings: upgrade while we have the
+        # plain password
+        user.update(
+            {"password": password_pool.hash(req_json["password"])},
+            commit=True,
+        )
     access_token = create_access_token(identity=user)
     refresh_token = create_refresh_token(identity=user)
     response = jsonify({"access_token": access_token})
@@ -89,7 +95,7 @@ def refresh():
 @auth_blueprint.route("/logout", methods=["POST"])
 @jwt_required()
 def logout():
-    current_user.update({"last_logout_at": db.func.now()}, commit=True)
+    current_user.update({"last_logout_at": utcnow()}, commit=True)
     response = jsonify({"message": gettext("Logout successful")})
     unset_jwt_cookies(response)
     return response, HTTPStatus.OK
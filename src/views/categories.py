@@ -4,30 +4,106 @@ from http import HTTPStatus
 
 from src.schemas.categories import (
     CategorySchema,
-    CategorySummarySchema,
+    CategoryListItemSchema,
     CategoryListRequestSchema,
+    CategoryListSchema,
+    CategoryOverviewRequestSchema,
+    CategoryOverviewResponseSchema,
     UpdateCategorySchema,
 )
 from src.models.categories import Category
-from src.models.users import User
-from src.extensions import db
-from src.views.utils import user_access_required
-
+from src.models.notes import Note
+from src.extensions import response_cache
+from src.views.utils import (
+    check_if_match,
+    conditional_response,
+    keyset_page,
+    resource_version,
+    tag_response,
+    user_access_required,
+)
 
-category_blueprint = Blueprint(
-    "category", __name__, url_prefix="/api/users/<int:user_id>/categories"
+category_blueprint = response_cache.invalidated_by(
+    Blueprint(
+        "category",
+        __name__,
+        url_prefix="/api/users/<int:user_id>/categories",
+    )
 )
 
 
+def categories_version(user_id):
+    # The list shows note counts and previews
+    return (
+        Category.change_stamp(Category.user_id == user_id),
+        Note.change_stamp(Note.user_id == user_id),
+    )
+
+
+def category_version(user_id, category_id):
+    return (
+        Category.change_stamp(
+            Category.user_id == user_id, Category.id == category_id
+        ),
+        Note.change_stamp(
+            Note.user_id == user_id, Note.category_id == category_id
+        ),
+    )
+
+
 @category_blueprint.route("/", methods=["GET"])
+@response_cache.cached
 @category_blueprint.arguments(CategoryListRequestSchema, location="query")
-@category_blueprint.response(200)
+@category_blueprint.response(200, CategoryListSchema(many=True))
 @jwt_required()
 @user_access_required
 def get_all_categories(args, user_id):
-    summary = args.get("summary", False)
-    schema = CategorySummarySchema if summary else CategorySchema
-    return schema(many=True).dump(Category.filter(user_id=user_id))
+    conditional_response(*categories_version(user_id))
+    if args["summary"]:
+        CategoryListSchema.project(exclude=("notes",))
+        return Category.filter(
+            user_id=user_id, name=args.get("name"), read_only=True
+        )
+    CategoryListSchema.project()
+    return Category.filter(
+        user_id=user_id, name=args.get("name"), with_notes=True
+    )
+
+
+@category_blueprint.route("/overview", methods=["GET"])
+@response_cache.cached
+@category_blueprint.arguments(CategoryOverviewRequestSchema, location="query")
+@category_blueprint.response(200, CategoryOverviewResponseSchema)
+@jwt_required()
+@user_access_required
+def get_category_overview(args, user_id):
+    conditional_response(*categories_version(user_id))
+    filters = {
+        key: value
+        for key, value in args.items()
+        if key not in ("summary", "notes_limit")
+    }
+    # One extra row tells whether there is another page that way. The
+    # page is only serialized, records skip the ORM's bookkeeping.
+    categories = Category.filter(
+        user_id=user_id,
+        read_only=True,
+        **{**filters, "limit": args["limit"] + 1},
+    )
+    page = keyset_page(
+        CategoryOverviewRequestSchema(),
+        args,
+        categories,
+        lambda c: {"cursor_created_at": c.created_at, "cursor_id": c.id},
+        user_id=user_id,
+    )
+    if args["summary"]:
+        CategoryListItemSchema.project(exclude=("notes",))
+        Category.with_note_previews(page["data"], 0)
+    else:
+        CategoryListItemSchema.project()
+        Category.with_note_previews(page["data"], args["notes_limit"])
+    return page
 
 
 @category_blueprint.route("/<int:category_id>", methods=["GET"])
@@ -35,6 +111,7 @@ def get_all_categories(args, user_id):
 @jwt_required()
 @user_access_required
 def get_category(user_id, category_id):
+    conditional_response(*category_version(user_id, category_id))
     return Category.find_category_by_user_and_id_or_404(user_id, category_id)
 
 
@@ -44,7 +121,6 @@ def get_category(user_id, category_id):
 @jwt_required()
 @user_access_required
 def create_category(json_data, user_id):
-    User.get_or_404(user_id)
     category = Category.create({**json_data, "user_id": user_id}, commit=True)
     return category
 
@@ -55,10 +131,20 @@ def create_category(json_data, user_id):
 @jwt_required()
 @user_access_required
 def update_category(json_data, user_id, category_id):
+    # Locked until the commit so that no update lands after the check
     category = Category.find_category_by_user_and_id_or_404(
-        user_id, category_id
+        user_id, category_id, for_update=True
+    )
+    category_stamp, notes_stamp = check_if_match(
+        *category_version(user_id, category_id)
     )
     category.update(json_data, commit=True)
+    # Only the category's updated_at moved, the new ETag is not read again
+    tag_response(
+        *resource_version(
+            [(category_stamp[0], category.updated_at), notes_stamp]
+        )
+    )
     return category
 
 
@@ -70,8 +156,11 @@ def delete_category(user_id, category_id):
     category = Category.find_category_by_user_and_id_or_404(
         user_id, category_id
     )
-    for note in category.notes:
-        note.update({"category_id": None}, commit=False)
-    db.session.commit()
+    # Detach notes, deleted ones included, in the same transaction
+    Note.bulk_update(
+        {"category_id": None},
+        Note.category_id == category.id,
+        include_deleted=True,
+    )
     category.soft_delete(commit=True)
     return "", HTTPStatus.NO_CONTENT
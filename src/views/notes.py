@@ -1,51 +1,124 @@
+import json
+
+from flask import Response, current_app, request, stream_with_context
+from marshmallow import ValidationError
 from flask_smorest import Blueprint
-from flask import url_for, request
 from http import HTTPStatus
 from flask_jwt_extended import jwt_required
 
 from src.schemas.notes import (
     NoteSchema,
-    FetchNotesResponseSchema,
+    ProjectedNoteSchema,
     FetchNotesRequestSchema,
+    FetchNotesResponseSchema,
+    NoteFieldsRequestSchema,
     UpdateNoteSchema,
+    NoteBatchRequestSchema,
+    NoteBatchResponseSchema,
+    NoteExportRequestSchema,
+    NoteImportRequestSchema,
+    NoteImportSchema,
+    NoteMassOperationSchema,
+    NoteMassOperationResponseSchema,
 )
 from src.models.notes import Note
 from src.models.categories import Category
-from src.views.utils import user_access_required
+from src.extensions import db, response_cache
+from src.schemas.categories import CategorySchema
+from src.streaming import (
+    chunked,
+    csv_lines,
+    csv_records,
+    gzipped,
+    ndjson_lines,
+    ndjson_records,
+    text_lines,
+)
+from src.views.utils import (
+    check_if_match,
+    conditional_response,
+    keyset_page,
+    resource_version,
+    tag_response,
+    user_access_required,
+)
 
-note_blueprint = Blueprint(
-    "note", __name__, url_prefix="/api/users/<int:user_id>/notes"
+note_blueprint = response_cache.invalidated_by(
+    Blueprint("note", __name__, url_prefix="/api/users/<int:user_id>/notes")
 )
 
 
+def notes_version(user_id):
+    # Notes embed their category's name
+    return (
+        Note.change_stamp(Note.user_id == user_id),
+        Category.change_stamp(Category.user_id == user_id),
+    )
+
+
+def note_version(user_id, note_id):
+    return (
+        Note.change_stamp(Note.user_id == user_id, Note.id == note_id),
+        Category.change_stamp(Category.user_id == user_id),
+    )
+
+
+EXPORT_FIELDS = (
+    "id",
+    "title",
+    "content",
+    "archived",
+    "category_id",
+    "category_name",
+    "created_at",
+    "updated_at",
+)
+
+
+def project_notes(args):
+    """Limit the notes dumped to the fields asked for, if any"""
+    if args.get("only"):
+        ProjectedNoteSchema.project(only=args["only"])
+    else:
+        ProjectedNoteSchema.project(exclude=("excerpt",))
+
+
 @note_blueprint.route("/", methods=["GET"])
+@response_cache.cached
 @note_blueprint.arguments(FetchNotesRequestSchema, location="query")
 @note_blueprint.response(200, FetchNotesResponseSchema)
 @jwt_required()
 @user_access_required
 def get_notes(args, user_id):
-    notes = Note.filter(user_id=user_id, **args)
-    next_cursor = notes[-1].created_at if notes else None
-    next_id = notes[-1].id if notes else None
-    url = None
-    if (next_cursor or next_id) and request.endpoint:
-        url = url_for(
-            request.endpoint,
-            user_id=user_id,
-            cursor_created_at=next_cursor,
-            cursor_id=next_id,
-            limit=args.get("limit", 100),
-            _external=False,
-        )
-    return {"data": notes, "next": url}
+    conditional_response(*notes_version(user_id))
+    # One extra row tells whether there is another page that way. The
+    # page is only serialized, records skip the ORM's bookkeeping.
+    notes = Note.filter(
+        user_id=user_id, read_only=True, **{**args, "limit": args["limit"] + 1}
+    )
+
+    def position(note):
+        if args.get("search"):
+            return {"cursor_rank": note.search_rank, "cursor_id": note.id}
+        return {"cursor_created_at": note.created_at, "cursor_id": note.id}
+
+    page = keyset_page(
+        FetchNotesRequestSchema(), args, notes, position, user_id=user_id
+    )
+    project_notes(args)
+    return page
 
 
 @note_blueprint.route("/<int:note_id>", methods=["GET"])
-@note_blueprint.response(200, NoteSchema)
+@note_blueprint.arguments(NoteFieldsRequestSchema, location="query")
+@note_blueprint.response(200, ProjectedNoteSchema)
 @jwt_required()
 @user_access_required
-def get_note(user_id, note_id):
-    return Note.find_note_by_user_and_id_or_404(user_id, note_id)
+def get_note(args, user_id, note_id):
+    conditional_response(*note_version(user_id, note_id))
+    note = Note.find_note_by_user_and_id_or_404(user_id, note_id, **args)
+    project_notes(args)
+    return note
 
 
 @note_blueprint.route("/", methods=["POST"])
@@ -55,7 +128,8 @@ def get_note(user_id, note_id):
 @user_access_required
 def create_note(json_data, user_id):
     if json_data.get("category_id"):
-        Category.find_category_by_user_and_id_or_404(
+        # Serialized with the note, handed over so it is not loaded again
+        json_data["category"] = Category.find_category_by_user_and_id_or_404(
             user_id, json_data["category_id"]
         )
     note = Note.create({**json_data, "user_id": user_id}, commit=True)
@@ -69,11 +143,23 @@ def create_note(json_data, user_id):
 @user_access_required
 def update_note(json_data, user_id, note_id):
     if json_data.get("category_id"):
-        Category.find_category_by_user_and_id_or_404(
+        json_data["category"] = Category.find_category_by_user_and_id_or_404(
             user_id, json_data["category_id"]
         )
-    note = Note.find_note_by_user_and_id_or_404(user_id, note_id)
+    # If-Match lets clients update without reading the note first. The
+    # note stays locked from the check to the commit, a concurrent update
+    # either waits for it or has already changed the ETag.
+    note = Note.find_note_by_user_and_id_or_404(
+        user_id, note_id, for_update=True
+    )
+    note_stamp, categories_stamp = check_if_match(
+        *note_version(user_id, note_id)
+    )
     note.update(json_data, commit=True)
+    # Only the note's updated_at moved, the new ETag is not read again
+    tag_response(
+        *resource_version([(note_stamp[0], note.updated_at), categories_stamp])
+    )
     return note
 
 
@@ -97,3 +183,131 @@ def restore_note(user_id, note_id):
     )
     note.restore(commit=True)
     return note
+
+
+@note_blueprint.route("/batch", methods=["POST"])
+@note_blueprint.arguments(NoteBatchRequestSchema, location="json")
+@note_blueprint.response(200)
+@jwt_required()
+@user_access_required
+def batch_notes(json_data, user_id):
+    operations = json_data["operations"]
+    # Every referenced category is checked in a single query
+    categories = Category.find_categories_by_user_and_ids(
+        user_id,
+        {
+            op["data"]["category_id"]
+            for op in operations
+            if op.get("data", {}).get("category_id") is not None
+        },
+    )
+    results = Note.apply_batch(user_id, operations, categories.keys())
+    db.session.commit()
+    return NoteBatchResponseSchema().dump({"results": results})
+
+
+@note_blueprint.route("/mass", methods=["POST"])
+@note_blueprint.arguments(NoteMassOperationSchema, location="json")
+@note_blueprint.response(200, NoteMassOperationResponseSchema)
+@jwt_required()
+@user_access_required
+def mass_update_notes(json_data, user_id):
+    action = json_data["action"]
+    if action == "move" and json_data["category_id"] is not None:
+        Category.find_category_by_user_and_id_or_404(
+            user_id, json_data["category_id"]
+        )
+    criteria = Note.filter_criteria(user_id, **json_data["filters"])
+    if json_data["dry_run"]:
+        affected = Note.count_active(*criteria)
+    elif action == "delete":
+        affected = Note.bulk_soft_delete(*criteria)
+    else:
+        values = {
+            "archive": {"archived": True},
+            "unarchive": {"archived": False},
+            "move": {"category_id": json_data.get("category_id")},
+        }[action]
+        affected = Note.bulk_update(values, *criteria)
+    db.session.commit()
+    return {"affected": affected, "dry_run": json_data["dry_run"]}
+
+
+@note_blueprint.route("/export", methods=["GET"])
+@note_blueprint.arguments(NoteExportRequestSchema, location="query")
+@note_blueprint.response(200)
+@jwt_required()
+@user_access_required
+def export_notes(args, user_id):
+    export_format = args.pop("format")
+    compress = args.pop("compress", None)
+    rows = Note.export_rows(user_id, **args)
+    if export_format == "csv":
+        lines, mimetype = csv_lines(rows, EXPORT_FIELDS), "text/csv"
+    else:
+        lines = ndjson_lines(rows, EXPORT_FIELDS)
+        mimetype = "application/x-ndjson"
+    body = chunked(lines)
+    filename = f"notes.{export_format}"
+    if compress == "gzip":
+        body = gzipped(body)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    # Written while the rows are read, never held in memory as a whole
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+def validate_import(records):
+    """Load each (line, record, error) with the note and category schemas"""
+    note_schema = NoteImportSchema()
+    category_schema = CategorySchema(only=("name",))
+    for line, record, error in records:
+        if error:
+            yield line, None, {"_schema": [error]}
+            continue
+        try:
+            data = note_schema.load(record)
+            if data["category_name"] is not None:
+                category_schema.load({"name": data["category_name"]})
+        except ValidationError as err:
+            yield line, None, err.messages
+            continue
+        yield line, data, None
+
+
+@note_blueprint.route("/import", methods=["POST"])
+@note_blueprint.arguments(NoteImportRequestSchema, location="query")
+@note_blueprint.response(200)
+@jwt_required()
+@user_access_required
+def import_notes(args, user_id):
+    """Import an NDJSON or CSV upload, as written by the export endpoint.
+
+    The upload is parsed while it is received and the response streams
+    one JSON line per rejected row and per committed batch.
+    """
+    lines = text_lines(request.stream, args.get("compress"))
+    if args["format"] == "csv":
+        records = csv_records(lines)
+    else:
+        records = ndjson_records(lines)
+    events = Note.import_records(
+        user_id,
+        validate_import(records),
+        batch_size=current_app.config["NOTE_IMPORT_BATCH_SIZE"],
+    )
+
+    def events_ndjson():
+        for event in events:
+            # Batches are committed after the response has started
+            if "imported" in event:
+                response_cache.invalidate(user_id)
+            yield json.dumps(event) + "\n"
+
+    return Response(
+        stream_with_context(events_ndjson()), mimetype="application/x-ndjson"
+    )
@@ -1,10 +1,13 @@
 from flask_smorest import Blueprint
 from flask_jwt_extended import jwt_required, current_user
 from http import HTTPStatus
+from src.extensions import response_cache
 from src.views.utils import user_access_required
 from src.schemas.users import UpdateUserSchema, UserSchema
 
-user_blueprint = Blueprint("user", __name__, url_prefix="/api/users")
+user_blueprint = response_cache.invalidated_by(
+    Blueprint("user", __name__, url_prefix="/api/users")
+)
 
 
 @user_blueprint.route("/<int:user_id>", methods=["PATCH"])
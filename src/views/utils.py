@@ -1,9 +1,22 @@
+import hashlib
+import json
+from datetime import datetime
+from functools import wraps
+from itertools import chain
+
+from flask import after_this_request, request, url_for
 from flask_jwt_extended import current_user
 from flask_smorest import abort
+from flask_smorest.exceptions import NotModified, PreconditionFailed
 from http import HTTPStatus
+from sqlalchemy import select
+
+from src.compression import matching_etag
+from src.extensions import db
 
 
 def user_access_required(func):
+    @wraps(func)
     def wrapper(*args, **kwargs):
         if not current_user:
             abort(HTTPStatus.UNAUTHORIZED, message="Missing or invalid token")
@@ -12,3 +25,107 @@ def user_access_required(func):
         return func(*args, **kwargs)
 
     return wrapper
+
+
+POSITION_KEYS = ("cursor_created_at", "cursor_rank", "cursor_id")
+
+
+def keyset_page(schema, args, items, position, **view_args):
+    """Build a paginated response from items fetched with limit + 1 rows.
+
+    ``position(item)`` returns the cursor arguments locating an item.
+    The next/prev links carry the filters in ``args`` in a cursor token
+    encoded with ``schema``.
+    """
+    limit = args["limit"]
+    backwards = args["direction"] == "prev"
+    has_more = len(items) > limit
+    if has_more:
+        items = items[1:] if backwards else items[:limit]
+    from_cursor = any(args.get(key) is not None for key in POSITION_KEYS)
+    filters = {
+        key: value
+        for key, value in args.items()
+        if key not in POSITION_KEYS and key != "direction"
+    }
+
+    def page_url(item, direction):
+        cursor = schema.encode_cursor(
+            {**filters, **position(item), "direction": direction}
+        )
+        return url_for(
+            request.endpoint, **view_args, cursor=cursor, _external=False
+        )
+
+    next_url = prev_url = None
+    if items and (backwards or has_more):
+        next_url = page_url(items[-1], "next")
+    if items and (has_more if backwards else from_cursor):
+        prev_url = page_url(items[0], "prev")
+    return {"data": items, "next": next_url, "prev": prev_url}
+
+
+def read_stamps(*stamps):
+    """Run the change stamps of a resource in a single query.
+
+    Returns the (count, latest updated_at) pair of each stamp.
+    """
+    values = iter(db.session.execute(select(*chain(*stamps))).one())
+    return list(zip(values, values))
+
+
+def resource_version(values):
+    """The strong ETag and the Last-Modified time read_stamps values
+    give"""
+    values = list(chain(*values))
+    plain = [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ]
+    etag = hashlib.sha1(json.dumps(plain).encode("utf-8")).hexdigest()
+    modified = [value for value in values if isinstance(value, datetime)]
+    return etag, max(modified, default=None)
+
+
+def tag_response(etag, last_modified, matched=None):
+    """Set the ETag and Last-Modified headers of the response"""
+
+    @after_this_request
+    def set_version_headers(response):
+        # A 304 names the representation the client already has
+        if response.status_code == HTTPStatus.NOT_MODIFIED and matched:
+            response.set_etag(matched)
+        else:
+            response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        return response
+
+
+def conditional_response(*stamps):
+    """Tag the response with the version of a resource.
+
+    GET answers 304 right away when If-None-Match holds the current ETag,
+    in any content coding, before anything is loaded or serialized.
+    """
+    etag, last_modified = resource_version(read_stamps(*stamps))
+    matched = None
+    if request.method in ("GET", "HEAD"):
+        matched = matching_etag(request.if_none_match, etag)
+    tag_response(etag, last_modified, matched)
+    if matched is not None:
+        raise NotModified
+
+
+def check_if_match(*stamps):
+    """Answer 412 when If-Match is sent and the resource has changed.
+
+    Returns the stamp values read, for a write to derive the version it
+    leaves the resource at without reading them again.
+    """
+    values = read_stamps(*stamps)
+    if request.if_match:
+        etag, _ = resource_version(values)
+        if matching_etag(request.if_match, etag) is None:
+            raise PreconditionFailed
+    return values
@@ -1,9 +1,13 @@
 import pytest
 import os
 from freezegun import freeze_time
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
 from flask_migrate import upgrade
+from contextlib import contextmanager
+from sqlalchemy import event, text
 from src import create_app
-from src.extensions import db
+from src.extensions import db, identity_cache
 from src.models.users import User
 
 TEST_DB_PATH = "test_db.sqlite"
@@ -50,6 +54,7 @@ class AuthenticatedClient:
 def app():
     test_config = {
         "TESTING": True,
+        "BCRYPT_LOG_ROUNDS": 4,
         "SQLALCHEMY_DATABASE_URI": os.getenv(
             "TEST_DATABASE_URL", f"sqlite:///{TEST_DB_PATH}"
         ),
@@ -77,6 +82,7 @@ def clean_db(app):
 
         # Optional: dispose engine if you see pytest hang at the end
         db.engine.dispose()
+    identity_cache.clear()
 
 
 @pytest.fixture
@@ -140,3 +146,65 @@ def frozen_time_client(client, test_user):
             return AuthenticatedClient(client, token)
 
     return create_client_at_time
+
+
+@pytest.fixture
+def explain_query(db_session):
+    """Returns a function giving the query plan of a statement as text."""
+
+    def explain(stmt):
+        compiled = stmt.compile(
+            db.engine, compile_kwargs={"literal_binds": True}
+        )
+        if db.engine.dialect.name == "postgresql":
+            # Tiny test tables would otherwise always be scanned
+            db.session.execute(text("SET LOCAL enable_seqscan = off"))
+            prefix = "EXPLAIN "
+        else:
+            prefix = "EXPLAIN QUERY PLAN "
+        rows = db.session.execute(text(prefix + str(compiled))).all()
+        db.session.rollback()
+        return "\n".join(str(row[-1]) for row in rows)
+
+    return explain
+
+
+@pytest.fixture
+def count_queries(db_session):
+    """Returns a context manager collecting the SQL run inside it."""
+
+    @contextmanager
+    def count():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(
+                db.engine, "before_cursor_execute", before_cursor_execute
+            )
+
+    return count
+
+
+@pytest.fixture
+def index_drift(db_session):
+    """Returns a function giving the names of the indexes autogenerate
+    would drop or create, against the migrated database."""
+
+    def drift():
+        with db.engine.connect() as connection:
+            diffs = compare_metadata(
+                MigrationContext.configure(connection), db.metadata
+            )
+        return {
+            diff[1].name
+            for diff in diffs
+            if diff[0] in ("add_index", "remove_index")
+        }
+
+    return drift
@@ -2,6 +2,19 @@ from sqlalchemy import select
 from http import HTTPStatus
 from freezegun import freeze_time
 from src.models.users import User
+from src.extensions import identity_cache, revocation_store, password_pool
+from src.revocation_store import RevocationStore, RevocationState
+from src.hashers import BcryptHasher
+import pytest
+import threading
+
+
+@pytest.fixture
+def shared_revocation_store(tmp_path):
+    path = str(tmp_path / "revocation")
+    revocation_store.open(path, slots=64)
+    yield path
+    revocation_store.close()
 
 
 class TestAuth:
@@ -250,3 +263,88 @@ class TestAuth:
         )
         assert login_response.status_code == HTTPStatus.OK
         assert "access_token" in login_response.get_json()
+
+    def test_identity_cache_serves_repeat_requests(
+        self, test_user, authenticated_client
+    ):
+        stats = identity_cache.stats()
+        response = authenticated_client.get("/api/auth/who_am_i")
+        assert response.status_code == HTTPStatus.OK
+        response = authenticated_client.get("/api/auth/who_am_i")
+        assert response.status_code == HTTPStatus.OK
+        new_stats = identity_cache.stats()
+        assert new_stats["misses"] - stats["misses"] <= 1
+        assert new_stats["hits"] - stats["hits"] >= 3
+
+    def test_identity_cache_invalidated_on_deactivation(
+        self, test_user, authenticated_client
+    ):
+        response = authenticated_client.get("/api/auth/who_am_i")
+        assert response.status_code == HTTPStatus.OK
+        test_user.update({"active": False}, commit=True)
+        response = authenticated_client.get("/api/auth/who_am_i")
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+        assert response.json.get("message") == "Token has been revoked."
+
+    def test_revocation_store_records_logout(
+        self, test_user, authenticated_client, shared_revocation_store
+    ):
+        response = authenticated_client.get("/api/auth/who_am_i")
+        assert response.status_code == HTTPStatus.OK
+        assert revocation_store.get(test_user.id) == RevocationState(
+            revoked=False, logout_epoch=None
+        )
+
+        response = authenticated_client.post("/api/auth/logout")
+        assert response.status_code == HTTPStatus.OK
+        assert revocation_store.get(test_user.id).logout_epoch is not None
+        response = authenticated_client.get("/api/auth/who_am_i")
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+        assert response.json.get("message") == "Token has been revoked."
+
+    def test_revocation_store_shared_between_workers(
+        self, test_user, authenticated_client, shared_revocation_store
+    ):
+        response = authenticated_client.get("/api/auth/who_am_i")
+        assert response.status_code == HTTPStatus.OK
+
+        other_worker = RevocationStore()
+        other_worker.open(shared_revocation_store, slots=64)
+        other_worker.put(test_user.id, RevocationState(True, None))
+        other_worker.close()
+
+        response = authenticated_client.get("/api/auth/who_am_i")
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+        assert response.json.get("message") == "Token has been revoked."
+
+    def test_login_rejected_when_password_pool_full(
+        self, client, test_user, monkeypatch
+    ):
+        full = threading.BoundedSemaphore(1)
+        full.acquire()
+        monkeypatch.setattr(password_pool, "_slots", full)
+        rejected = password_pool.stats()["rejected"]
+        response = client.post(
+            "/api/auth/login",
+            json={"email": test_user.email, "password": "password123@AAA"},
+        )
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert response.headers["Retry-After"] == "1"
+        assert password_pool.stats()["rejected"] == rejected + 1
+
+    def test_login_rehashes_outdated_password_hash(
+        self, client, test_user, db_session
+    ):
+        test_user.update(
+            {"password": BcryptHasher(rounds=5).hash("password123@AAA")},
+            commit=True,
+        )
+        assert password_pool.needs_rehash(test_user.password)
+        response = client.post(
+            "/api/auth/login",
+            json={"email": test_user.email, "password": "password123@AAA"},
+        )
+        assert response.status_code == HTTPStatus.OK
+        db_session.session.refresh(test_user)
+        assert test_user.password.startswith("$2b$04$")
+        assert not password_pool.needs_rehash(test_user.password)
@@ -0,0 +1,300 @@
+from http import HTTPStatus
+
+from src.models.categories import Category
+from src.models.notes import Note
+
+
+class TestCategories:
+    def test_filter_categories_by_name_substring(self, test_user, db_session):
+        for name in ["Personal Finance", "Work", "Homework", "Fun"]:
+            Category.create({"user_id": test_user.id, "name": name})
+        db_session.session.commit()
+
+        names = {c.name for c in Category.filter(test_user.id, name="WORK")}
+        assert names == {"Work", "Homework"}
+        names = {c.name for c in Category.filter(test_user.id, name="n")}
+        assert names == {"Personal Finance", "Fun"}
+
+    def test_get_all_categories(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        work = Category.create({"user_id": test_user.id, "name": "Work"})
+        Category.create({"user_id": test_user.id, "name": "Home"})
+        db_session.session.flush()
+        for i in range(3):
+            Note.create(
+                {
+                    "user_id": test_user.id,
+                    "title": f"Note {i}",
+                    "category_id": work.id,
+                }
+            )
+        db_session.session.commit()
+        db_session.session.expire_all()
+        url = f"/api/users/{test_user.id}/categories/"
+
+        with count_queries() as statements:
+            response = authenticated_client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        # Every category with all of its notes: the ETag stamps and a
+        # single query for the notes of every category
+        by_name = {c["name"]: c for c in response.json}
+        assert {n["title"] for n in by_name["Work"]["notes"]} == {
+            "Note 0",
+            "Note 1",
+            "Note 2",
+        }
+        assert by_name["Home"]["notes"] == []
+        assert len([s for s in statements if "FROM notes" in s]) == 2
+
+        response = authenticated_client.get(f"{url}?summary=true&name=wor")
+        assert response.status_code == HTTPStatus.OK
+        assert [c["name"] for c in response.json] == ["Work"]
+        assert "notes" not in response.json[0]
+
+    def test_get_category_overview_bounds_note_previews(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        categories = [
+            Category.create({"user_id": test_user.id, "name": name})
+            for name in ["Work", "Home", "Empty"]
+        ]
+        db_session.session.flush()
+        for i in range(8):
+            Note.create(
+                {
+                    "user_id": test_user.id,
+                    "title": f"Work {i}",
+                    "category_id": categories[0].id,
+                }
+            )
+        Note.create(
+            {
+                "user_id": test_user.id,
+                "title": "Home",
+                "category_id": categories[1].id,
+            }
+        )
+        db_session.session.commit()
+        url = f"/api/users/{test_user.id}/categories/overview"
+
+        with count_queries() as statements:
+            response = authenticated_client.get(f"{url}?notes_limit=3")
+        assert response.status_code == HTTPStatus.OK
+        by_name = {c["name"]: c for c in response.json["data"]}
+        assert by_name["Work"]["note_count"] == 8
+        assert [n["title"] for n in by_name["Work"]["notes"]] == [
+            "Work 7",
+            "Work 6",
+            "Work 5",
+        ]
+        assert by_name["Home"]["note_count"] == 1
+        assert by_name["Empty"]["note_count"] == 0
+        assert by_name["Empty"]["notes"] == []
+        # Previews come from one windowed query, never one per category
+        assert len([s for s in statements if "row_number()" in s]) == 1
+        assert not [s for s in statements if s.startswith("SELECT notes.")]
+
+        response = authenticated_client.get(f"{url}?summary=true")
+        assert response.status_code == HTTPStatus.OK
+        assert all("notes" not in c for c in response.json["data"])
+        assert {c["note_count"] for c in response.json["data"]} == {8, 1, 0}
+
+    def test_category_list_index_matches_migrations(self, index_drift):
+        assert "idx_categories_user_list" not in index_drift()
+
+    def test_get_category_overview_pagination(
+        self, test_user, authenticated_client, db_session
+    ):
+        for i in range(5):
+            Category.create({"user_id": test_user.id, "name": f"C{i}"})
+        db_session.session.commit()
+        url = f"/api/users/{test_user.id}/categories/overview?limit=2"
+
+        names = []
+        pages = 0
+        while url:
+            response = authenticated_client.get(url)
+            assert response.status_code == HTTPStatus.OK
+            names.extend(c["name"] for c in response.json["data"])
+            url = response.json["next"]
+            pages += 1
+        assert pages == 3
+        assert names == ["C4", "C3", "C2", "C1", "C0"]
+
+        response = authenticated_client.get(response.json["prev"])
+        assert [c["name"] for c in response.json["data"]] == ["C2", "C1"]
+
+    def test_delete_category_detaches_notes_in_one_update(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        category = Category.create({"user_id": test_user.id, "name": "Work"})
+        db_session.session.flush()
+        notes = [
+            Note.create(
+                {
+                    "user_id": test_user.id,
+                    "title": f"Note {i}",
+                    "category_id": category.id,
+                }
+            )
+            for i in range(5)
+        ]
+        db_session.session.flush()
+        notes[0].soft_delete()
+        db_session.session.commit()
+
+        with count_queries() as statements:
+            response = authenticated_client.delete(
+                f"/api/users/{test_user.id}/categories/{category.id}"
+            )
+        assert response.status_code == HTTPStatus.NO_CONTENT
+        updates = [s for s in statements if s.startswith("UPDATE notes")]
+        assert len(updates) == 1
+        assert all(note.category_id is None for note in notes)
+        assert Category.get_by_id(category.id) is None
+
+    def test_category_endpoints_check_owner_in_category_query(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        category = Category.create(
+            {"user_id": test_user.id, "name": "Work"}, commit=True
+        )
+        url = f"/api/users/{test_user.id}/categories/"
+        item_url = f"{url}{category.id}"
+        db_session.session.expire_all()
+
+        for request in (
+            lambda: authenticated_client.get(item_url),
+            lambda: authenticated_client.post(url, json={"name": "Home"}),
+            lambda: authenticated_client.delete(item_url),
+        ):
+            with count_queries() as statements:
+                response = request()
+            assert response.status_code < 300
+            # Only the identity lookup, when not cached, reads users
+            assert len([s for s in statements if "FROM users" in s]) <= 1
+
+    def test_category_writes_are_not_reloaded(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        url = f"/api/users/{test_user.id}/categories/"
+        with count_queries() as statements:
+            response = authenticated_client.post(url, json={"name": "Work"})
+        assert response.status_code == HTTPStatus.CREATED
+        # A new category has no notes to load
+        assert statements[-1].startswith("INSERT INTO categories")
+        assert response.json["notes"] == []
+        created = response.json
+        # Read back from the database, not the instance still in session
+        db_session.session.expire_all()
+        assert authenticated_client.get(f"{url}{created['id']}").json == (
+            created
+        )
+
+        with count_queries() as statements:
+            response = authenticated_client.put(
+                f"{url}{created['id']}", json={"name": "Job"}
+            )
+        assert response.status_code == HTTPStatus.OK
+        assert response.json["name"] == "Job"
+        # The category is not selected again after its UPDATE
+        (update,) = [s for s in statements if s.startswith("UPDATE")]
+        written = statements.index(update) + 1
+        after = statements[written:]
+        assert not [s for s in after if s.startswith("SELECT categories.")]
+        updated = response.json
+        db_session.session.expire_all()
+        assert authenticated_client.get(f"{url}{created['id']}").json == (
+            updated
+        )
+
+    def test_created_category_lists_notes_added_later(
+        self, test_user, db_session
+    ):
+        category = Category.create({"user_id": test_user.id, "name": "Work"})
+        db_session.session.flush()
+        note = Note.create(
+            {
+                "user_id": test_user.id,
+                "title": "Note",
+                "category_id": category.id,
+            },
+            commit=True,
+        )
+        assert category.notes == [note]
+
+        other = Category.create(
+            {"user_id": test_user.id, "name": "Home"}, commit=True
+        )
+        note.update({"category_id": other.id}, commit=True)
+        assert category.notes == []
+        assert other.notes == [note]
+
+    def test_find_category_checks_owner(self, test_user, db_session):
+        category = Category.create(
+            {"user_id": test_user.id, "name": "Work"}, commit=True
+        )
+        assert (
+            Category.find_category_by_user_and_id(test_user.id, category.id)
+            is category
+        )
+        test_user.soft_delete(commit=True)
+        assert (
+            Category.find_category_by_user_and_id(test_user.id, category.id)
+            is None
+        )
+
+    def test_get_category_conditional(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        category = Category.create(
+            {"user_id": test_user.id, "name": "Work"}, commit=True
+        )
+        url = f"/api/users/{test_user.id}/categories/{category.id}"
+        etag = authenticated_client.get(url).headers["ETag"]
+        response = authenticated_client.get(
+            url, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+        # The category lists its notes
+        Note.create(
+            {
+                "user_id": test_user.id,
+                "title": "Note",
+                "category_id": category.id,
+            },
+            commit=True,
+        )
+        response = authenticated_client.get(
+            url, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == HTTPStatus.OK
+        etag = response.headers["ETag"]
+
+        response = authenticated_client.put(
+            url, json={"name": "Home"}, headers={"If-Match": '"stale"'}
+        )
+        assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+        with count_queries() as statements:
+            response = authenticated_client.put(
+                url, json={"name": "Home"}, headers={"If-Match": etag}
+            )
+        assert response.status_code == HTTPStatus.OK
+        # The category is locked before its ETag is checked, the new ETag
+        # is derived from the write rather than read again
+        (select_category,) = [
+            s for s in statements if s.startswith("SELECT categories.")
+        ]
+        (stamps,) = [s for s in statements if "count(*)" in s]
+        assert statements.index(select_category) < statements.index(stamps)
+        assert authenticated_client.get(url).headers["ETag"] == (
+            response.headers["ETag"]
+        )
+        list_url = f"/api/users/{test_user.id}/categories/"
+        etag = authenticated_client.get(list_url).headers["ETag"]
+        response = authenticated_client.get(
+            list_url, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
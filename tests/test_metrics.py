@@ -0,0 +1,172 @@
+import json
+import os
+import subprocess
+import sys
+from http import HTTPStatus
+
+import pytest
+from flask import Flask
+
+from src.extensions import metrics, password_pool
+from src.metrics import Metrics
+
+
+@pytest.fixture
+def node_metrics(app, tmp_path):
+    """Metrics shared through a directory, as under gunicorn"""
+    app.config["METRICS_DIR"] = str(tmp_path)
+    metrics.init_app(app)
+    yield metrics
+    app.config["METRICS_DIR"] = None
+    metrics.init_app(app)
+
+
+def parse(text):
+    samples = {}
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+class TestMetrics:
+    def test_metrics(self, test_user, authenticated_client, client):
+        metrics.clear()
+        for _ in range(2):
+            authenticated_client.get(f"/api/users/{test_user.id}/notes/")
+        authenticated_client.get(f"/api/users/{test_user.id}/notes/0")
+
+        response = client.get("/metrics")
+        assert response.status_code == HTTPStatus.OK
+        assert response.mimetype == "text/plain"
+        samples = parse(response.text)
+        series = 'endpoint="note.get_notes",method="GET"'
+        assert (
+            samples[f'notes_http_requests_total{{{series},status="200"}}'] == 2
+        )
+        assert (
+            samples[
+                'notes_http_requests_total{endpoint="note.get_note",'
+                'method="GET",status="404"}'
+            ]
+            == 1
+        )
+        family = "notes_http_request_duration_seconds"
+        buckets = [
+            line.split('le="')[1]
+            for line in response.text.splitlines()
+            if line.startswith(f"{family}_bucket{{{series}")
+        ]
+        bounds = [bucket.split('"')[0] for bucket in buckets]
+        assert bounds == [str(float(b)) for b in metrics.buckets] + ["+Inf"]
+        counts = [float(bucket.split(" ")[-1]) for bucket in buckets]
+        assert counts == sorted(counts) and counts[-1] == 2
+        assert samples[f"{family}_count{{{series}}}"] == 2
+        assert samples[f"{family}_sum{{{series}}}"] > 0
+        ratio = samples['notes_cache_hit_ratio{cache="identity_cache"}']
+        assert 0 < ratio <= 1
+        assert "notes_db_pool_checked_out" in samples
+        stats = password_pool.stats()
+        assert samples["notes_password_hash_duration_seconds_sum"] == (
+            stats["latency_total"]
+        )
+        assert (
+            samples["notes_password_hash_duration_seconds_count"]
+            == stats["completed"]
+        )
+        assert "# TYPE notes_http_request_duration_seconds histogram" in (
+            response.text
+        )
+
+    def test_metrics_add_up_workers(self, app, client, node_metrics):
+        client.get("/metrics")
+        # A worker that has exited and one that is still running
+        finished = subprocess.Popen([sys.executable, "-c", ""])
+        finished.wait()
+        series = [
+            ["endpoint", "metrics"],
+            ["method", "GET"],
+            ["status", "200"],
+        ]
+        for pid in (finished.pid, os.getppid()):
+            snapshot = {
+                "pid": pid,
+                "samples": [
+                    ["notes_http_requests_total", "", series, 5],
+                    ["notes_db_pool_checked_out", "", [], 3],
+                    [
+                        "notes_cache_hits_total",
+                        "",
+                        [["cache", "response_cache"]],
+                        3,
+                    ],
+                    [
+                        "notes_cache_misses_total",
+                        "",
+                        [["cache", "response_cache"]],
+                        1,
+                    ],
+                ],
+            }
+            path = os.path.join(node_metrics.directory, f"{pid}.json")
+            with open(path, "w") as file:
+                json.dump(snapshot, file)
+
+        samples = parse(client.get("/metrics").text)
+        # Counters of both workers, the gauge of the live one only
+        assert (
+            samples[
+                'notes_http_requests_total{endpoint="metrics",'
+                'method="GET",status="200"}'
+            ]
+            == 11
+        )
+        own = {
+            family: value
+            for family, _, labels, value in node_metrics.collect()
+            if not labels
+        }
+        assert samples["notes_db_pool_checked_out"] == (
+            own["notes_db_pool_checked_out"] + 3
+        )
+        assert samples['notes_cache_hit_ratio{cache="response_cache"}'] == (
+            0.75
+        )
+        assert os.path.exists(
+            os.path.join(node_metrics.directory, f"{os.getpid()}.json")
+        )
+
+    def test_metrics_need_token_outside_debug(self):
+        def serves_metrics(**config):
+            app = Flask(__name__)
+            app.config.update(config)
+            Metrics(app)
+            return "metrics" in {
+                rule.endpoint for rule in app.url_map.iter_rules()
+            }
+
+        assert not serves_metrics()
+        assert serves_metrics(METRICS_TOKEN="scrape")
+        assert serves_metrics(DEBUG=True)
+        assert not serves_metrics(DEBUG=True, METRICS_ENABLED=False)
+
+    def test_metrics_token(self, app, client):
+        app.config["METRICS_TOKEN"] = "scrape"
+        metrics.init_app(app)
+        try:
+            assert client.get("/metrics").status_code == (
+                HTTPStatus.UNAUTHORIZED
+            )
+            for header in ("Bearer scrap", "Bearer scrapé"):
+                response = client.get(
+                    "/metrics", headers={"Authorization": header}
+                )
+                assert response.status_code == HTTPStatus.UNAUTHORIZED
+            response = client.get(
+                "/metrics", headers={"Authorization": "Bearer scrape"}
+            )
+            assert response.status_code == HTTPStatus.OK
+        finally:
+            app.config["METRICS_TOKEN"] = None
+            metrics.init_app(app)
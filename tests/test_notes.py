@@ -1,8 +1,51 @@
+import csv
+import gzip
+import io
+import json
+import math
 from http import HTTPStatus
+from pytest import param
+import pytest
 from datetime import datetime, timedelta, timezone
 
 from src.models.notes import Note
 from src.models.users import User
+from src.models.categories import Category
+from flask.json.provider import DefaultJSONProvider
+from marshmallow import Schema
+
+from src.extensions import compression, profiler, response_cache
+from src.json_provider import ORJSONProvider, orjson
+from src.response_cache import SQLiteVersions
+from src.schemas.categories import (
+    CategoryListItemSchema,
+    CategorySchema,
+)
+from src.schemas.notes import NoteSchema, SparseNoteSchema
+from src.schemas.users import UserSchema
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def enabled_response_cache(request, app, tmp_path):
+    app.config["RESPONSE_CACHE_BACKEND"] = request.param
+    app.config["RESPONSE_CACHE_PATH"] = str(tmp_path / "responses.db")
+    response_cache.init_app(app)
+    yield response_cache
+    app.config["RESPONSE_CACHE_BACKEND"] = None
+    response_cache.init_app(app)
+
+
+@pytest.fixture
+def enabled_profiler(app):
+    app.config["PROFILER_ENABLED"] = True
+    app.config["PROFILER_SLOW_QUERY_MS"] = 0
+    app.config["PROFILER_QUERY_BUDGET"] = 1
+    profiler.init_app(app)
+    yield profiler
+    app.config["PROFILER_ENABLED"] = False
+    app.config["PROFILER_SLOW_QUERY_MS"] = 100
+    app.config["PROFILER_QUERY_BUDGET"] = None
+    profiler.init_app(app)
 
 
 class TestNotes:
@@ -39,20 +82,39 @@ class TestNotes:
         assert len(response.json["data"]) == 5
         assert response.json["data"][0]["title"] == "Note 5"
         assert response.json["data"][-1]["title"] == "Note 1"
-        expected_datetime = response.json["data"][-1]["created_at"].replace(
-            "T", "+"
+        assert response.json["next"] is None
+        assert response.json["prev"] is None
+
+        response = authenticated_client.get(
+            f"/api/users/{test_user.id}/notes/?limit=3"
         )
-        assert (
-            response.json["next"]
-            == f"/api/users/{test_user.id}/notes/?cursor_created_at="
-            f"{expected_datetime}&cursor_id="
-            f'{response.json["data"][-1]["id"]}&limit=100'
+        assert [n["title"] for n in response.json["data"]] == [
+            "Note 5",
+            "Note 4",
+            "Note 3",
+        ]
+        assert response.json["prev"] is None
+        assert response.json["next"].startswith(
+            f"/api/users/{test_user.id}/notes/?cursor="
         )
         response = authenticated_client.get(response.json["next"])
         assert response.status_code == HTTPStatus.OK
-        assert len(response.json["data"]) == 0
+        assert [n["title"] for n in response.json["data"]] == [
+            "Note 2",
+            "Note 1",
+        ]
         assert response.json["next"] is None
 
+        response = authenticated_client.get(response.json["prev"])
+        assert response.status_code == HTTPStatus.OK
+        assert [n["title"] for n in response.json["data"]] == [
+            "Note 5",
+            "Note 4",
+            "Note 3",
+        ]
+        assert response.json["prev"] is None
+        assert response.json["next"] is not None
+
     def test_get_notes_with_pagination_limit(
         self, test_user, authenticated_client
     ):
@@ -252,3 +314,1024 @@ class TestNotes:
             f"/users/{test_user.id}/notes/{note.id}"
         )
         assert get_response.status_code == HTTPStatus.NOT_FOUND
+
+    def test_search_notes_title_and_content(
+        self, test_user, authenticated_client
+    ):
+        for title, content in [
+            ("Groceries", "Buy milk and bread"),
+            ("Milk", "Milk tea recipe with milk foam"),
+            ("Work", "Finish the quarterly report"),
+        ]:
+            Note.create(
+                {"user_id": test_user.id, "title": title, "content": content}
+            )
+        deleted = Note.create(
+            {"user_id": test_user.id, "title": "Milk", "content": "old"},
+            commit=True,
+        )
+        deleted.soft_delete(commit=True)
+
+        response = authenticated_client.get(
+            f"/api/users/{test_user.id}/notes/?search=milk&limit=1"
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert [note["title"] for note in response.json["data"]] == ["Milk"]
+
+        response = authenticated_client.get(response.json["next"])
+        assert response.status_code == HTTPStatus.OK
+        assert [note["title"] for note in response.json["data"]] == [
+            "Groceries"
+        ]
+        assert response.json["next"] is None
+
+        response = authenticated_client.get(response.json["prev"])
+        assert [note["title"] for note in response.json["data"]] == ["Milk"]
+
+    def test_search_notes_after_update(self, test_user, authenticated_client):
+        note = Note.create(
+            {"user_id": test_user.id, "title": "Draft", "content": "todo"},
+            commit=True,
+        )
+        response = authenticated_client.put(
+            f"/api/users/{test_user.id}/notes/{note.id}",
+            json={"content": 'Plan the "offsite" agenda'},
+        )
+        assert response.status_code == HTTPStatus.OK
+
+        response = authenticated_client.get(
+            f"/api/users/{test_user.id}/notes/?search=todo"
+        )
+        assert response.json["data"] == []
+        response = authenticated_client.get(
+            f'/api/users/{test_user.id}/notes/?search="offsite" agenda'
+        )
+        assert [n["id"] for n in response.json["data"]] == [note.id]
+
+    def test_get_notes_filter_title_short_and_wildcards(
+        self, test_user, authenticated_client
+    ):
+        for title in ["100% done", "1000 things", "to_do", "todo"]:
+            Note.create({"user_id": test_user.id, "title": title})
+
+        response = authenticated_client.get(
+            f"/api/users/{test_user.id}/notes/?title=0%25"
+        )
+        assert [n["title"] for n in response.json["data"]] == ["100% done"]
+        response = authenticated_client.get(
+            f"/api/users/{test_user.id}/notes/?title=O_D"
+        )
+        assert [n["title"] for n in response.json["data"]] == ["to_do"]
+
+    @pytest.mark.parametrize(
+        "filters, index",
+        [
+            param({}, "idx_notes_user_list"),
+            param({"archived": True}, "idx_notes_user_list"),
+            param({"category_id": 1}, "idx_notes_user_category_list"),
+            param(
+                {"cursor_created_at": datetime(2030, 1, 1), "cursor_id": 9},
+                "idx_notes_user_list",
+            ),
+            param(
+                {
+                    "cursor_created_at": datetime(2030, 1, 1),
+                    "cursor_id": 9,
+                    "direction": "prev",
+                },
+                "idx_notes_user_list",
+            ),
+        ],
+    )
+    def test_note_list_query_uses_list_index(
+        self, test_user, explain_query, filters, index
+    ):
+        plan = explain_query(Note.select_filtered(test_user.id, **filters))
+        assert index in plan
+        assert "TEMP B-TREE" not in plan
+        assert "Sort" not in plan
+
+    def test_note_list_indexes_match_migrations(self, index_drift):
+        drift = index_drift()
+        assert "idx_notes_user_list" not in drift
+        assert "idx_notes_user_category_list" not in drift
+
+    def test_get_notes_cursor_keeps_filters(
+        self, test_user, authenticated_client
+    ):
+        for i in range(4):
+            Note.create(
+                {
+                    "user_id": test_user.id,
+                    "title": f"Task {i+1}" if i % 2 else f"Idea {i+1}",
+                }
+            )
+        response = authenticated_client.get(
+            f"/api/users/{test_user.id}/notes/?title=task&limit=1"
+        )
+        assert [n["title"] for n in response.json["data"]] == ["Task 4"]
+
+        # Arguments next to a cursor are ignored in favour of its filters
+        response = authenticated_client.get(
+            response.json["next"] + "&title=idea&limit=50"
+        )
+        assert [n["title"] for n in response.json["data"]] == ["Task 2"]
+        assert response.json["next"] is None
+
+    def test_get_notes_invalid_cursor(self, test_user, authenticated_client):
+        response = authenticated_client.get(
+            f"/api/users/{test_user.id}/notes/?cursor=tampered"
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert response.json["details"]["query"]["cursor"] == [
+            "Invalid cursor"
+        ]
+
+    def test_get_notes_query_count_independent_of_page_size(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        for i in range(10):
+            category = Category.create(
+                {"user_id": test_user.id, "name": f"Category {i}"}
+            )
+            db_session.session.flush()
+            Note.create(
+                {
+                    "user_id": test_user.id,
+                    "title": f"Note {i}",
+                    "category_id": category.id,
+                }
+            )
+        db_session.session.commit()
+        url = f"/api/users/{test_user.id}/notes/"
+
+        counts = []
+        for limit in (2, 10):
+            db_session.session.expire_all()
+            with count_queries() as statements:
+                response = authenticated_client.get(f"{url}?limit={limit}")
+            assert response.status_code == HTTPStatus.OK
+            assert len(response.json["data"]) == limit
+            assert all(n["category"]["name"] for n in response.json["data"])
+            counts.append(len(statements))
+        assert counts[0] == counts[1]
+
+    def test_get_notes_sparse_fields(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        work = Category.create({"user_id": test_user.id, "name": "Work"})
+        db_session.session.flush()
+        for i in range(3):
+            Note.create(
+                {
+                    "user_id": test_user.id,
+                    "title": f"Note {i}",
+                    "content": f"Body of note {i}",
+                    "category_id": work.id,
+                }
+            )
+        db_session.session.commit()
+        url = f"/api/users/{test_user.id}/notes/"
+
+        db_session.session.expire_all()
+        with count_queries() as statements:
+            response = authenticated_client.get(
+                f"{url}?fields=id,title,excerpt&excerpt_length=7&limit=2"
+            )
+        assert response.status_code == HTTPStatus.OK
+        assert response.json["data"] == [
+            {"id": note.id, "title": note.title, "excerpt": "Body of"}
+            for note in Note.get_active(user_id=test_user.id)[::-1][:2]
+        ]
+        (select_notes,) = [
+            s for s in statements if "FROM notes" in s and "LIMIT" in s
+        ]
+        columns = select_notes.split(" FROM ")[0]
+        assert "substr(notes.content" in columns
+        assert "notes.content AS" not in columns
+        assert "categories" not in select_notes
+
+        # The cursor keeps the fieldset
+        response = authenticated_client.get(response.json["next"])
+        assert set(response.json["data"][0]) == {"id", "title", "excerpt"}
+
+        response = authenticated_client.get(
+            f"{url}{response.json['data'][0]['id']}?fields=title,category"
+        )
+        assert response.json == {
+            "title": "Note 0",
+            "category": {"id": work.id, "name": "Work"},
+        }
+        response = authenticated_client.get(f"{url}?limit=1")
+        assert "excerpt" not in response.json["data"][0]
+        assert response.json["data"][0]["content"] == "Body of note 2"
+
+        response = authenticated_client.get(f"{url}?fields=id,password")
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    def test_batch_notes(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        category = Category.create({"user_id": test_user.id, "name": "Work"})
+        other_user = User.create(
+            {"first_name": "O", "last_name": "U", "email": "o@example.com"}
+        )
+        db_session.session.flush()
+        foreign = Category.create({"user_id": other_user.id, "name": "Theirs"})
+        existing = Note.create({"user_id": test_user.id, "title": "Old"})
+        gone = Note.create({"user_id": test_user.id, "title": "Gone"})
+        db_session.session.flush()
+        gone.soft_delete(commit=True)
+        operations = [
+            {"op": "create", "data": {"title": f"New {i}"}} for i in range(20)
+        ] + [
+            {
+                "op": "create",
+                "data": {"title": "Filed", "category_id": category.id},
+            },
+            {
+                "op": "create",
+                "data": {"title": "x", "category_id": foreign.id},
+            },
+            {"op": "update", "id": existing.id, "data": {"title": "Edited"}},
+            {"op": "delete", "id": existing.id},
+            {"op": "restore", "id": gone.id},
+            {"op": "update", "id": 999999, "data": {"title": "Missing"}},
+        ]
+
+        with count_queries() as statements:
+            response = authenticated_client.post(
+                f"/api/users/{test_user.id}/notes/batch",
+                json={"operations": operations},
+            )
+        assert response.status_code == HTTPStatus.OK
+        results = response.json["results"]
+        assert [r["status"] for r in results] == [HTTPStatus.CREATED] * 21 + [
+            HTTPStatus.NOT_FOUND,
+            HTTPStatus.OK,
+            HTTPStatus.NO_CONTENT,
+            HTTPStatus.OK,
+            HTTPStatus.NOT_FOUND,
+        ]
+        assert results[20]["data"]["category"]["name"] == "Work"
+        assert results[22]["data"]["title"] == "Edited"
+        # Creates are one multi-row INSERT where the dialect can return
+        # ids in order (Postgres), one per row on SQLite
+        others = [s for s in statements if not s.startswith("INSERT")]
+        assert len(others) < 10
+
+        db_session.session.expire_all()
+        assert Note.get_by_id(existing.id) is None
+        assert Note.get_by_id(gone.id).title == "Gone"
+        titles = {n.title for n in Note.get_active(user_id=test_user.id)}
+        assert {"New 0", "New 19", "Filed"} <= titles
+        assert "x" not in titles
+
+    def test_batch_notes_validation(
+        self, test_user, authenticated_client, app
+    ):
+        url = f"/api/users/{test_user.id}/notes/batch"
+        response = authenticated_client.post(
+            url, json={"operations": [{"op": "update", "data": {}}]}
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        response = authenticated_client.post(
+            url, json={"operations": [{"op": "create", "data": {}}]}
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        limit = app.config["NOTE_BATCH_MAX_OPERATIONS"]
+        response = authenticated_client.post(
+            url,
+            json={"operations": [{"op": "delete", "id": 1}] * (limit + 1)},
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    def test_mass_operations(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        work = Category.create({"user_id": test_user.id, "name": "Work"})
+        home = Category.create({"user_id": test_user.id, "name": "Home"})
+        db_session.session.flush()
+        for i in range(6):
+            Note.create(
+                {
+                    "user_id": test_user.id,
+                    "title": f"Report {i}" if i % 2 else f"Memo {i}",
+                    "category_id": work.id,
+                }
+            )
+        db_session.session.commit()
+        url = f"/api/users/{test_user.id}/notes/mass"
+
+        response = authenticated_client.post(
+            url,
+            json={
+                "action": "archive",
+                "filters": {"title": "report"},
+                "dry_run": True,
+            },
+        )
+        assert response.json == {"affected": 3, "dry_run": True}
+        assert Note.count_active(Note.archived.is_(True)) == 0
+
+        with count_queries() as statements:
+            response = authenticated_client.post(
+                url, json={"action": "archive", "filters": {"title": "report"}}
+            )
+        assert response.json == {"affected": 3, "dry_run": False}
+        assert [s for s in statements if s.startswith("SELECT notes")] == []
+        assert len([s for s in statements if s.startswith("UPDATE")]) == 1
+
+        response = authenticated_client.post(
+            url,
+            json={
+                "action": "move",
+                "filters": {"category_id": work.id},
+                "category_id": home.id,
+            },
+        )
+        assert response.json["affected"] == 6
+        response = authenticated_client.post(
+            url, json={"action": "delete", "filters": {"archived": False}}
+        )
+        assert response.json["affected"] == 3
+
+        db_session.session.expire_all()
+        notes = Note.get_active(user_id=test_user.id)
+        assert len(notes) == 3
+        assert all(n.archived and n.category_id == home.id for n in notes)
+
+    def test_mass_move_validates_destination(
+        self, test_user, authenticated_client
+    ):
+        url = f"/api/users/{test_user.id}/notes/mass"
+        response = authenticated_client.post(
+            url, json={"action": "move", "all": True}
+        )
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        response = authenticated_client.post(
+            url, json={"action": "move", "category_id": 999999, "all": True}
+        )
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+    def test_mass_operation_requires_filters_or_all(
+        self, test_user, authenticated_client, db_session
+    ):
+        for i in range(3):
+            Note.create({"user_id": test_user.id, "title": f"Note {i}"})
+        db_session.session.commit()
+        url = f"/api/users/{test_user.id}/notes/mass"
+
+        for body in (
+            {"action": "delete"},
+            {"action": "delete", "filters": {}},
+            {"action": "delete", "filters": {"archived": None}},
+            {"action": "delete", "all": False},
+        ):
+            response = authenticated_client.post(url, json=body)
+            assert response.status_code == HTTPStatus.BAD_REQUEST
+            assert "filters" in response.json["details"]["json"]
+        assert Note.count_active(Note.user_id == test_user.id) == 3
+
+        response = authenticated_client.post(
+            url, json={"action": "delete", "all": True, "dry_run": True}
+        )
+        assert response.json == {"affected": 3, "dry_run": True}
+        response = authenticated_client.post(
+            url, json={"action": "delete", "all": True}
+        )
+        assert response.json == {"affected": 3, "dry_run": False}
+        assert Note.count_active(Note.user_id == test_user.id) == 0
+
+    def test_export_notes(self, test_user, authenticated_client, db_session):
+        work = Category.create({"user_id": test_user.id, "name": "Work"})
+        db_session.session.flush()
+        for i in range(5):
+            Note.create(
+                {
+                    "user_id": test_user.id,
+                    "title": f"Note {i}",
+                    "content": "line one\nline, two",
+                    "archived": i == 4,
+                    "category_id": work.id if i % 2 else None,
+                }
+            )
+        Note.create({"user_id": test_user.id, "title": "Gone"}).soft_delete()
+        db_session.session.commit()
+        url = f"/api/users/{test_user.id}/notes/export"
+
+        response = authenticated_client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        assert response.is_streamed
+        assert response.mimetype == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["title"] for r in rows] == [f"Note {i}" for i in range(5)]
+        assert rows[1]["category_name"] == "Work"
+        assert rows[0]["category_name"] is None
+        assert rows[4]["archived"] is True
+
+        response = authenticated_client.get(
+            f"{url}?format=csv&compress=gzip&archived=false"
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.mimetype == "application/gzip"
+        assert "notes.csv.gz" in response.headers["Content-Disposition"]
+        text = gzip.decompress(response.data).decode("utf-8")
+        rows = list(csv.DictReader(io.StringIO(text)))
+        assert len(rows) == 4
+        assert rows[0]["content"] == "line one\nline, two"
+
+    def test_import_notes(
+        self, test_user, authenticated_client, db_session, app
+    ):
+        Category.create({"user_id": test_user.id, "name": "Work"}, commit=True)
+        app.config["NOTE_IMPORT_BATCH_SIZE"] = 2
+        lines = [
+            {"title": "One", "category_name": "Work"},
+            {"title": "Two", "content": "x", "category_name": "Ideas"},
+            {"content": "no title"},
+            {"title": "Three", "archived": True, "id": 7, "category_id": 3},
+            {"title": "Four", "category_name": ""},
+            {"title": "x" * 101},
+        ]
+        body = "\n".join(json.dumps(line) for line in lines) + "\nnot json\n"
+        try:
+            response = authenticated_client.post(
+                f"/api/users/{test_user.id}/notes/import"
+                "?format=ndjson&compress=gzip",
+                data=gzip.compress(body.encode("utf-8")),
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+        finally:
+            app.config["NOTE_IMPORT_BATCH_SIZE"] = 1000
+        assert response.status_code == HTTPStatus.OK
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert events[0] == {"imported": 2, "failed": 0}
+        assert events[1]["line"] == 3
+        assert "title" in events[1]["errors"]
+        # Longer than the title column, rejected rather than failing a batch
+        assert events[-3]["line"] == 6
+        assert "title" in events[-3]["errors"]
+        assert events[-2]["line"] == 7
+        assert events[-1] == {"imported": 4, "failed": 3, "done": True}
+
+        db_session.session.expire_all()
+        notes = {n.title: n for n in Note.get_active(user_id=test_user.id)}
+        assert set(notes) == {"One", "Two", "Three", "Four"}
+        assert notes["One"].category.name == "Work"
+        assert notes["Two"].category.name == "Ideas"
+        assert notes["Three"].archived and notes["Three"].category_id is None
+        assert notes["Four"].category_id is None
+
+    def test_import_notes_stops_at_unreadable_row(
+        self, test_user, authenticated_client, db_session, app
+    ):
+        app.config["NOTE_IMPORT_BATCH_SIZE"] = 2
+        # Past the csv module's field size limit
+        corrupt = '"' + "x" * (csv.field_size_limit() + 1) + '"'
+        body = f"title,category_name\nOne,\nTwo,\nThree,Ideas\n{corrupt},\n"
+        try:
+            response = authenticated_client.post(
+                f"/api/users/{test_user.id}/notes/import?format=csv",
+                data=body.encode("utf-8"),
+                headers={"Content-Type": "text/csv"},
+            )
+        finally:
+            app.config["NOTE_IMPORT_BATCH_SIZE"] = 1000
+        assert response.status_code == HTTPStatus.OK
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert events[0] == {"imported": 2, "failed": 0}
+        assert events[-1]["imported"] == 2
+        assert events[-1]["error"].startswith("Line 5: field larger")
+        assert "done" not in events[-1]
+
+        # The first batch stays, the one being read is rolled back
+        db_session.session.expire_all()
+        notes = Note.get_active(user_id=test_user.id)
+        assert {n.title for n in notes} == {"One", "Two"}
+        assert Category.get_active(user_id=test_user.id) == []
+
+    def test_import_notes_round_trips_csv_export(
+        self, test_user, authenticated_client, db_session
+    ):
+        work = Category.create({"user_id": test_user.id, "name": "Work"})
+        db_session.session.flush()
+        Note.create(
+            {
+                "user_id": test_user.id,
+                "title": 'Quoted, "title"',
+                "content": "two\nlines",
+                "category_id": work.id,
+            },
+            commit=True,
+        )
+        url = f"/api/users/{test_user.id}/notes"
+        exported = authenticated_client.get(f"{url}/export?format=csv").data
+        response = authenticated_client.post(
+            f"{url}/import?format=csv",
+            data=exported,
+            headers={"Content-Type": "text/csv"},
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.text.splitlines()[-1] == json.dumps(
+            {"imported": 1, "failed": 0, "done": True}
+        )
+        notes = Note.get_active(user_id=test_user.id, title='Quoted, "title"')
+        assert len(notes) == 2
+        assert {n.content for n in notes} == {"two\nlines"}
+        assert {n.category_id for n in notes} == {work.id}
+
+    def test_get_note_conditional(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        note = Note.create(
+            {"user_id": test_user.id, "title": "Note"}, commit=True
+        )
+        url = f"/api/users/{test_user.id}/notes/{note.id}"
+        response = authenticated_client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        etag = response.headers["ETag"]
+        assert response.last_modified is not None
+
+        with count_queries() as statements:
+            response = authenticated_client.get(
+                url, headers={"If-None-Match": etag}
+            )
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+        assert response.headers["ETag"] == etag
+        assert not [s for s in statements if s.startswith("SELECT notes.")]
+
+        response = authenticated_client.put(
+            url, json={"title": "Stale"}, headers={"If-Match": '"stale"'}
+        )
+        assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+        with count_queries() as statements:
+            response = authenticated_client.put(
+                url, json={"title": "Edited"}, headers={"If-Match": etag}
+            )
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["ETag"] != etag
+        # The note is locked before its ETag is checked, the new ETag is
+        # derived from the write rather than read again
+        (select_note,) = [
+            s for s in statements if s.startswith("SELECT notes.")
+        ]
+        (stamps,) = [s for s in statements if "count(*)" in s]
+        assert statements.index(select_note) < statements.index(stamps)
+        written = response
+
+        response = authenticated_client.get(
+            url, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.json["title"] == "Edited"
+        assert response.headers["ETag"] == written.headers["ETag"]
+        assert response.last_modified == written.last_modified
+
+    @pytest.mark.parametrize(
+        "method, suffix, json, expected_status, expected_queries",
+        [
+            # identity, ETag stamps, note
+            ("get", "", None, HTTPStatus.OK, 3),
+            # identity, note, UPDATE
+            ("delete", "", None, HTTPStatus.NO_CONTENT, 3),
+            # identity, note, UPDATE; nothing is reloaded after the commit
+            ("post", "/restore", None, HTTPStatus.OK, 3),
+        ],
+    )
+    def test_note_endpoints_check_owner_in_note_query(
+        self,
+        test_user,
+        authenticated_client,
+        count_queries,
+        db_session,
+        method,
+        suffix,
+        json,
+        expected_status,
+        expected_queries,
+    ):
+        note = Note.create({"user_id": test_user.id, "title": "Note"})
+        if suffix == "/restore":
+            note.soft_delete()
+        db_session.session.commit()
+        url = f"/api/users/{test_user.id}/notes/{note.id}{suffix}"
+        db_session.session.expire_all()
+
+        with count_queries() as statements:
+            response = getattr(authenticated_client, method)(url, json=json)
+        assert response.status_code == expected_status
+        # Only the identity lookup reads users on its own
+        assert len([s for s in statements if "FROM users" in s]) == 1
+        assert len(statements) == expected_queries
+
+    def test_note_writes_are_not_reloaded(
+        self, test_user, authenticated_client, count_queries, db_session
+    ):
+        work = Category.create({"user_id": test_user.id, "name": "Work"})
+        home = Category.create({"user_id": test_user.id, "name": "Home"})
+        db_session.session.commit()
+        url = f"/api/users/{test_user.id}/notes/"
+        work_id, home_id = work.id, home.id
+        # Requests start from an empty session, as they would in production
+        db_session.session.expunge_all()
+        del work, home
+
+        with count_queries() as statements:
+            response = authenticated_client.post(
+                url, json={"title": "Note", "category_id": work_id}
+            )
+        assert response.status_code == HTTPStatus.CREATED
+        # The INSERT is the last statement, the response is what was written
+        assert statements[-1].startswith("INSERT INTO notes")
+        assert len([s for s in statements if "FROM categories" in s]) == 1
+        created = response.json
+        assert created["category"] == {"id": work_id, "name": "Work"}
+        # Read back from the database, not the instances still in session
+        db_session.session.expunge_all()
+        assert authenticated_client.get(f"{url}{created['id']}").json == (
+            created
+        )
+        db_session.session.expunge_all()
+
+        with count_queries() as statements:
+            response = authenticated_client.put(
+                f"{url}{created['id']}",
+                json={"title": "Moved", "category_id": home_id},
+            )
+        assert response.status_code == HTTPStatus.OK
+        (update,) = [s for s in statements if s.startswith("UPDATE")]
+        # The new category is read once, to check its owner
+        assert (
+            len([s for s in statements if s.startswith("SELECT categories.")])
+            == 1
+        )
+        # Nothing is read after the UPDATE, the ETag stamps included
+        assert statements[-1] == update
+        assert response.json["category"] == {"id": home_id, "name": "Home"}
+        assert response.json["updated_at"] > created["updated_at"]
+        db_session.session.expunge_all()
+        assert authenticated_client.get(f"{url}{created['id']}").json == (
+            response.json
+        )
+
+    def test_find_note_checks_owner(self, test_user, db_session):
+        note = Note.create(
+            {"user_id": test_user.id, "title": "Note"}, commit=True
+        )
+        assert Note.find_note_by_user_and_id(test_user.id, note.id) is note
+        test_user.active = False
+        db_session.session.commit()
+        assert Note.find_note_by_user_and_id(test_user.id, note.id) is None
+        test_user.active = True
+        test_user.soft_delete()
+        db_session.session.commit()
+        assert Note.find_note_by_user_and_id(test_user.id, note.id) is None
+
+    def test_get_notes_conditional(
+        self, test_user, authenticated_client, db_session
+    ):
+        category = Category.create({"user_id": test_user.id, "name": "Work"})
+        db_session.session.flush()
+        Note.create(
+            {
+                "user_id": test_user.id,
+                "title": "Note",
+                "category_id": category.id,
+            },
+            commit=True,
+        )
+        url = f"/api/users/{test_user.id}/notes/"
+        etag = authenticated_client.get(url).headers["ETag"]
+        response = authenticated_client.get(
+            url, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+        # The list shows category names
+        category.update({"name": "Renamed"}, commit=True)
+        response = authenticated_client.get(
+            url, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == HTTPStatus.OK
+        etag = response.headers["ETag"]
+
+        Note.create({"user_id": test_user.id, "title": "New"}, commit=True)
+        response = authenticated_client.get(
+            url, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == HTTPStatus.OK
+
+    def test_response_cache(
+        self,
+        test_user,
+        authenticated_client,
+        count_queries,
+        enabled_response_cache,
+    ):
+        Note.create({"user_id": test_user.id, "title": "One"}, commit=True)
+        url = f"/api/users/{test_user.id}/notes/"
+        first = authenticated_client.get(url)
+        assert first.status_code == HTTPStatus.OK
+
+        with count_queries() as statements:
+            cached = authenticated_client.get(url)
+        assert cached.json == first.json
+        assert cached.headers["ETag"] == first.headers["ETag"]
+        assert not [s for s in statements if "FROM notes" in s]
+        response = authenticated_client.get(
+            url, headers={"If-None-Match": first.headers["ETag"]}
+        )
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+        # The ETag of a compressed representation validates as well
+        gzip_etag = first.headers["ETag"][:-1] + '-gzip"'
+        response = authenticated_client.get(
+            url, headers={"If-None-Match": gzip_etag}
+        )
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+        assert response.headers["ETag"] == gzip_etag
+        # Other arguments are another entry
+        response = authenticated_client.get(f"{url}?limit=1")
+        assert response.status_code == HTTPStatus.OK
+        stats = enabled_response_cache.stats()
+        assert (stats["hits"], stats["misses"]) == (3, 2)
+        assert stats["entries"] == 2 and stats["bytes"] > 0
+
+        # Every write invalidates the user's entries
+        response = authenticated_client.post(url, json={"title": "Two"})
+        assert response.status_code == HTTPStatus.CREATED
+        response = authenticated_client.get(url)
+        assert [n["title"] for n in response.json["data"]] == ["Two", "One"]
+        category_url = f"/api/users/{test_user.id}/categories/"
+        authenticated_client.get(category_url)
+        authenticated_client.post(category_url, json={"name": "Work"})
+        response = authenticated_client.get(category_url)
+        assert [c["name"] for c in response.json] == ["Work"]
+
+    def test_response_cache_is_per_user(
+        self, test_user, authenticated_client, enabled_response_cache
+    ):
+        url = f"/api/users/{test_user.id}/notes/"
+        assert authenticated_client.get(url).status_code == HTTPStatus.OK
+        other = User.create(
+            {"first_name": "O", "last_name": "U", "email": "o@example.com"},
+            commit=True,
+        )
+        response = authenticated_client.get(f"/api/users/{other.id}/notes/")
+        assert response.status_code == HTTPStatus.FORBIDDEN
+        response = authenticated_client.client.get(url)
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    def test_response_cache_invalidated_by_other_workers(
+        self, app, test_user, authenticated_client, enabled_response_cache
+    ):
+        url = f"/api/users/{test_user.id}/notes/"
+        assert authenticated_client.get(url).json["data"] == []
+        # A write handled by another worker, through its own connection
+        other_worker = SQLiteVersions(app.config["RESPONSE_CACHE_PATH"])
+        Note.create({"user_id": test_user.id, "title": "One"}, commit=True)
+        other_worker.bump(test_user.id)
+
+        response = authenticated_client.get(url)
+        assert [n["title"] for n in response.json["data"]] == ["One"]
+        assert enabled_response_cache.stats()["hits"] == 0
+
+    def test_compressed_responses(
+        self, test_user, authenticated_client, db_session
+    ):
+        for i in range(20):
+            Note.create(
+                {
+                    "user_id": test_user.id,
+                    "title": f"Note {i}",
+                    "content": "Lorem ipsum dolor sit amet " * 10,
+                }
+            )
+        note = Note.create({"user_id": test_user.id, "title": "Short"})
+        db_session.session.commit()
+        url = f"/api/users/{test_user.id}/notes/"
+        before = compression.stats()["gzip"]
+
+        plain = authenticated_client.get(url)
+        assert "Content-Encoding" not in plain.headers
+        assert plain.headers["Vary"] == "Accept-Encoding"
+        response = authenticated_client.get(
+            url, headers={"Accept-Encoding": "br;q=0.9, gzip;q=0.5"}
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert int(response.headers["Content-Length"]) == len(response.data)
+        assert gzip.decompress(response.data) == plain.data
+        after = compression.stats()["gzip"]
+        assert after["responses"] == before["responses"] + 1
+        assert after["bytes_saved"] > before["bytes_saved"]
+
+        # Each coding has its own strong ETag, either one validates
+        assert response.headers["ETag"] == plain.headers["ETag"][:-1] + (
+            '-gzip"'
+        )
+        for etag in (plain.headers["ETag"], response.headers["ETag"]):
+            conditional = authenticated_client.get(
+                url,
+                headers={"Accept-Encoding": "gzip", "If-None-Match": etag},
+            )
+            assert conditional.status_code == HTTPStatus.NOT_MODIFIED
+            assert conditional.headers["ETag"] == etag
+        note_url = f"{url}{note.id}"
+        etag = authenticated_client.get(note_url).headers["ETag"]
+        response = authenticated_client.put(
+            note_url,
+            json={"title": "Edited"},
+            headers={"If-Match": etag[:-1] + '-gzip"'},
+        )
+        assert response.status_code == HTTPStatus.OK
+        response = authenticated_client.put(
+            note_url,
+            json={"title": "Stale"},
+            headers={"If-Match": etag[:-1] + '-gzip"'},
+        )
+        assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+
+        # Below COMPRESSION_MIN_SIZE, or gzip refused
+        for path, accept in [
+            (f"{url}{note.id}", "gzip"),
+            (url, "gzip;q=0, identity"),
+        ]:
+            response = authenticated_client.get(
+                path, headers={"Accept-Encoding": accept}
+            )
+            assert "Content-Encoding" not in response.headers
+
+        # Streamed exports are compressed as they are written, exports
+        # that are already gzip files are left alone
+        response = authenticated_client.get(
+            f"{url}export", headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" not in response.headers
+        lines = gzip.decompress(response.data).decode("utf-8").splitlines()
+        assert len(lines) == 21
+        response = authenticated_client.get(
+            f"{url}export?compress=gzip", headers={"Accept-Encoding": "gzip"}
+        )
+        assert "Content-Encoding" not in response.headers
+        assert len(gzip.decompress(response.data).splitlines()) == 21
+
+    def test_profiler(
+        self,
+        test_user,
+        authenticated_client,
+        count_queries,
+        enabled_profiler,
+        caplog,
+        db_session,
+    ):
+        note = Note.create({"user_id": test_user.id, "title": "Timed"})
+        db_session.session.commit()
+        requests = enabled_profiler.stats()["requests"]
+        url = f"/api/users/{test_user.id}/notes/{note.id}"
+
+        with count_queries() as statements:
+            response = authenticated_client.get(url)
+        assert response.status_code == HTTPStatus.OK
+        timings = dict(
+            metric.split(";", 1)
+            for metric in response.headers["Server-Timing"].split(", ")
+        )
+        assert set(timings) == {"db", "serialize", "total"}
+        assert timings["db"].endswith(f'desc="{len(statements)} queries"')
+        assert enabled_profiler.stats()["requests"] == requests + 1
+
+        slow = [
+            r.getMessage()
+            for r in caplog.records
+            if r.getMessage().startswith("Slow query")
+            and " in note.get_note: " in r.getMessage()
+        ]
+        assert len(slow) == len(statements)
+        assert any(
+            message.endswith(f"({test_user.id}, {note.id})")
+            for message in slow
+        )
+        assert any(
+            f"note.get_note ran {len(statements)} queries, over the budget"
+            in r.getMessage()
+            for r in caplog.records
+        )
+
+    def test_compiled_schemas_match_marshmallow(self, test_user, db_session):
+        work = Category.create(
+            {"user_id": test_user.id, "name": "Work", "color": None}
+        )
+        db_session.session.flush()
+        Note.create(
+            {
+                "user_id": test_user.id,
+                "title": "工作 ✓",
+                "content": "x",
+                "category_id": work.id,
+            }
+        )
+        Note.create({"user_id": test_user.id, "title": "Loose"})
+        db_session.session.commit()
+        notes = Note.get_active(user_id=test_user.id)
+        Category.with_note_previews([work], 5)
+
+        cases = [
+            (NoteSchema(), notes[0]),
+            (NoteSchema(many=True), notes),
+            (CategorySchema(), work),
+            (CategorySchema(exclude=("notes",), many=True), [work]),
+            (CategoryListItemSchema(), work),
+            (UserSchema(), test_user),
+        ]
+        for schema, obj in cases:
+            assert schema.dump(obj) == Schema.dump(schema, obj)
+
+    def test_read_only_notes_match_entities(self, test_user, db_session):
+        work = Category.create({"user_id": test_user.id, "name": "Work"})
+        db_session.session.flush()
+        for i in range(3):
+            Note.create(
+                {
+                    "user_id": test_user.id,
+                    "title": f"Milk {i}",
+                    "content": "Buy milk " * i,
+                    "category_id": work.id if i % 2 else None,
+                }
+            )
+        db_session.session.commit()
+        db_session.session.expunge_all()
+
+        for filters, schema in [
+            ({}, NoteSchema(many=True)),
+            ({"search": "milk"}, NoteSchema(many=True)),
+            ({"direction": "prev"}, NoteSchema(many=True)),
+            (
+                {"only": ["title", "category"], "excerpt_length": 4},
+                SparseNoteSchema(only=["title", "category"], many=True),
+            ),
+            (
+                {"only": ["excerpt"], "excerpt_length": 4},
+                SparseNoteSchema(only=["excerpt"], many=True),
+            ),
+        ]:
+            records = Note.filter(test_user.id, read_only=True, **filters)
+            # Records are never tracked by the session
+            assert not db_session.session.identity_map
+            entities = Note.filter(test_user.id, **filters)
+            assert schema.dump(records) == schema.dump(entities)
+            assert [r.id for r in records] == [e.id for e in entities]
+            if filters.get("search"):
+                assert [r.search_rank for r in records] == [
+                    e.search_rank for e in entities
+                ]
+            db_session.session.expunge_all()
+
+        # Notes of the same category share its record
+        records = Note.filter(test_user.id, read_only=True)
+        assert len({id(r.category) for r in records if r.category}) == 1
+
+        schema = CategoryListItemSchema(many=True)
+        records = Category.filter(test_user.id, read_only=True)
+        entities = Category.filter(test_user.id)
+        for categories in (records, entities):
+            Category.with_note_previews(categories, 2)
+        assert schema.dump(records) == schema.dump(entities)
+        assert schema.dump(records) == Schema.dump(schema, records)
+
+    @pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+    def test_orjson_provider_matches_default(self, app):
+        payload = {
+            "title": "工作 😀  ",
+            "at": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+            "nested": [{"b": 1, "a": None, "c": True}],
+            "big": 2**70,
+        }
+        default = DefaultJSONProvider(app)
+        provider = ORJSONProvider(app)
+        for data in (payload, {1: "x", 10: "y", 2: "z"}, [1.5, "é"]):
+            assert provider.dumps(
+                data, separators=(",", ":")
+            ) == default.dumps(data, separators=(",", ":"))
+            assert provider.dumps(data) == default.dumps(data)
+        default.ensure_ascii = provider.ensure_ascii = False
+        assert provider.dumps(payload, separators=(",", ":")) == default.dumps(
+            payload, separators=(",", ":")
+        )
+        assert provider.loads('{"a": [1, "\\u00e9"]}') == {"a": [1, "é"]}
+        # orjson rejects NaN, the standard library accepts it
+        assert math.isnan(provider.loads("[NaN]")[0])
+
+    @pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+    def test_orjson_provider_non_finite_floats(self, app):
+        # Where the providers differ: orjson writes null for what json
+        # writes as the non-JSON NaN and Infinity
+        data = [math.nan, math.inf, -math.inf, 1.5]
+        compact = {"separators": (",", ":")}
+        assert DefaultJSONProvider(app).dumps(data, **compact) == (
+            "[NaN,Infinity,-Infinity,1.5]"
+        )
+        assert ORJSONProvider(app).dumps(data, **compact) == (
+            "[null,null,null,1.5]"
+        )